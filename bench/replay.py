@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.toggle_latency import ToggleBenchmark, summarize
+import src.constants as c
+
+class ReplayBenchmark(ToggleBenchmark):
+    def __init__(self, args: argparse.Namespace):
+        super().__init__(args)
+        from src.trace import Trace
+        self.trace = Trace.load(args.trace)
+        self.app.conf.ignore_left_alt = True
+
+    def toggles_ime(self, scan_code: int, name: str | None):
+        return scan_code == c.K_HANGEUL or (scan_code == c.K_ALT and name is not None and "right" in name)
+
+    def replay(self):
+        speed = self.args.speed
+        held: set[int] = set()
+        feed_times = []
+        popups_before = len(self.popups)
+        first: float | None = None
+        started = time.perf_counter()
+        for timestamp, event_type, name, scan_code in self.trace:
+            if speed > 0:
+                if first is None:
+                    first = timestamp
+                if (delay := (timestamp - first) / speed - (time.perf_counter() - started)) > 0:
+                    time.sleep(delay)
+            # the IME flips on the press only, auto-repeats do not toggle it again
+            if event_type == "down" and scan_code not in held and self.toggles_ime(scan_code, name):
+                self.desktop.press_toggle()
+            if event_type == "down" and scan_code not in c.MAKE_ONLY_KEYS: held.add(scan_code)
+            else: held.discard(scan_code)
+
+            fed = time.perf_counter()
+            self.app.keyboard.feed(self.KeyboardEvent(event_type, scan_code, name, time=timestamp))
+            feed_times.append(time.perf_counter() - fed)
+        elapsed = time.perf_counter() - started
+        time.sleep(c.IME_SETTLE_TOGGLE_DEADLINE)
+
+        self.results["replay"] = {
+            "events": len(self.trace),
+            "speed": speed,
+            "elapsed_s": elapsed,
+            "events_per_s": len(self.trace) / elapsed if elapsed else float("nan"),
+            "popups": len(self.popups) - popups_before,
+        } | self.app.keyboard.input_stats()
+        self.results["hook_return"] = summarize(feed_times)
+
+    def drive(self):
+        try:
+            time.sleep(0.2) # let the mainloop start
+            self.replay()
+        finally:
+            self.app.ui.commands.post("quit", self.app.quit)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded key trace through the keyboard handlers")
+    parser.add_argument("trace", help="trace file saved from the tray menu (logs/keys.krtrace)")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier, 0 replays as fast as possible")
+    parser.add_argument("--ime-settle-ms", type=float, default=5)
+    parser.add_argument("--ime-query-us", type=float, default=200)
+    parser.add_argument("--monitor-query-us", type=float, default=50)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    args.trace = os.path.abspath(args.trace)
+
+    # config.json and logs/ are written to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="krt-replay-"))
+    results = ReplayBenchmark(args).run()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, values in results.items():
+        print(name)
+        for key, value in values.items():
+            print(f"  {key}: {value:.3f}" if isinstance(value, float) else f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()
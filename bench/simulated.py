@@ -0,0 +1,18 @@
+from src.backends import use
+from src.backends.simulated import SimulatedBackend
+
+def install(backend: SimulatedBackend):
+    # must run before anything imports src.cpp, which binds the backend at import time
+    use(backend)
+
+def make_keyboard_monitor():
+    from src.monitor import KeyboardMonitor
+
+    class SimulatedKeyboardMonitor(KeyboardMonitor):
+        def install(self):
+            pass # events are fed by the benchmark instead of the OS hook
+
+        def feed(self, e: KeyboardMonitor.Event):
+            self.dispatch(e)
+
+    return SimulatedKeyboardMonitor
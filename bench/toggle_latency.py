@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.simulated import SimulatedBackend, install, make_keyboard_monitor
+import src.constants as c
+
+def percentile(values: list[float], p: float):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+def summarize(values: list[float]):
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": max(values) * 1000 if values else float("nan"),
+    }
+
+class ToggleBenchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        monitor_query_latency = args.monitor_query_us / 1e6
+        self.desktop = SimulatedBackend(
+            ime_settle_delay=args.ime_settle_ms / 1000,
+            latency={
+                "ime_conversion_mode": args.ime_query_us / 1e6,
+                "monitor_from_point": monitor_query_latency,
+                "monitor_from_window": monitor_query_latency,
+                "monitor_rect": monitor_query_latency,
+            },
+            monitors=((0, 0, 1920, 1080), (1920, 0, 4480, 1440)),
+        )
+        install(self.desktop)
+
+        import keyboard
+        import main
+        main.KeyboardMonitor = make_keyboard_monitor()
+        self.KeyboardEvent = keyboard.KeyboardEvent
+
+        self.app = main.AppConductor()
+        self.app.conf.monitor_conf = c.E_MONITORCONF.CURSOR
+        self.app.conf.ignore_left_alt = False
+
+        self.popups: list[float] = []
+        self.popup_shown = threading.Event()
+        show_popup = self.app.ui.show_popup
+        def timed_show_popup(text):
+            show_popup(text)
+            self.popups.append(time.perf_counter())
+            self.popup_shown.set()
+        self.app.ui.show_popup = timed_show_popup
+
+        self.alpha_writes = 0
+        set_alpha = self.app.ui.set_alpha
+        def counted_set_alpha(alpha):
+            self.alpha_writes += 1
+            set_alpha(alpha)
+        self.app.ui.set_alpha = counted_set_alpha
+
+        self.results: dict[str, dict] = {}
+
+    def press(self):
+        self.desktop.press_toggle()
+        self.app.keyboard.feed(self.KeyboardEvent("down", c.K_HANGEUL, "hangul"))
+        self.app.keyboard.feed(self.KeyboardEvent("up", c.K_HANGEUL, "hangul"))
+
+    def bench_latency(self):
+        latencies = []
+        for i in range(self.args.toggles):
+            self.desktop.cursor = (10, 10) if i % 2 == 0 else (2000, 10)
+            self.popup_shown.clear()
+            started = time.perf_counter()
+            self.press()
+            if not self.popup_shown.wait(1.0):
+                continue
+            latencies.append(self.popups[-1] - started)
+            time.sleep(self.args.interval_ms / 1000)
+        self.results["toggle_to_popup"] = summarize(latencies)
+        self.results["toggle_to_popup"]["settle_p50_ms"] = (self.app.settle.settle_percentile(0.5) or 0) * 1000
+
+    def bench_storm(self):
+        before = len(self.popups)
+        started = time.perf_counter()
+        fed = 0
+        while time.perf_counter() - started < self.args.storm_seconds:
+            self.press()
+            fed += 1
+            time.sleep(self.args.storm_interval_ms / 1000)
+        time.sleep(c.IME_SETTLE_TOGGLE_DEADLINE)
+        elapsed = time.perf_counter() - started
+        self.results["toggle_storm"] = {
+            "toggles": fed,
+            "toggles_per_s": fed / elapsed,
+            "popups": len(self.popups) - before,
+            "popups_per_s": (len(self.popups) - before) / elapsed,
+        } | self.app.keyboard.input_stats()
+
+    def bench_fade(self):
+        self.app.conf.window_lifetime = 0
+        self.app.conf.fade_duration = self.args.fade_seconds
+        self.alpha_writes = 0
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        self.app.show_language("A")
+        time.sleep(self.args.fade_seconds + 0.1)
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - started
+        self.results["fade"] = {
+            "duration_s": self.args.fade_seconds,
+            "cpu_ms": cpu * 1000,
+            "cpu_percent": cpu / wall * 100,
+            "alpha_writes": self.alpha_writes,
+        }
+
+    def drive(self):
+        try:
+            time.sleep(0.2) # let the mainloop start
+            self.bench_latency()
+            self.bench_storm()
+            self.bench_fade()
+        finally:
+            self.app.ui.commands.post("quit", self.app.quit)
+
+    def run(self):
+        threading.Thread(target=self.drive, name="BenchmarkDriver", daemon=True).start()
+        self.app.ui.run()
+        return self.results
+
+def main():
+    parser = argparse.ArgumentParser(description="Toggle-to-popup latency benchmark with simulated keyboard and IME")
+    parser.add_argument("--toggles", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=20)
+    parser.add_argument("--ime-settle-ms", type=float, default=5)
+    parser.add_argument("--ime-query-us", type=float, default=200)
+    parser.add_argument("--monitor-query-us", type=float, default=50)
+    parser.add_argument("--storm-seconds", type=float, default=2)
+    parser.add_argument("--storm-interval-ms", type=float, default=1)
+    parser.add_argument("--fade-seconds", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    # config.json and logs/ are written to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="krt-bench-"))
+    results = ToggleBenchmark(args).run()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, values in results.items():
+        print(name)
+        for key, value in values.items():
+            print(f"  {key}: {value:.3f}" if isinstance(value, float) else f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()
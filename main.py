@@ -1,65 +1,149 @@
-import time
-import pyglet
+import os
+import sys
 
-from src.logger import get_logger
+from src.profiler import startup_profile
+from src.logger import get_logger, shutdown as shutdown_logging, LOGS_DIR
 from src.ui import AppUI
 from src.tray import AppTray
 from src.utils import build_resource
 from src.conf import Configuration
-from src.cpp import LanguageDetector
+from src.cpp import LanguageDetector, register_font
 from src.monitor import KeyboardMonitor
+from src.settle import ImeSettleScheduler
+from src.watcher import ImeWatcher
+from src.metrics import MetricsServer
+from src.ipc import IpcServer, acquire_instance, hand_off
 from src.logger import KeyPressLogger
+from src.trace import TraceRecorder
+from src import memory
 
 import src.constants as c
 
-pyglet.font.add_file(build_resource("Pretendard-Regular.otf"))
-
-key_logger = KeyPressLogger()
-
 class AppConductor:
-    def __init__(self):
+    def __init__(self, ipc_name: str | None = None):
         self.logger = get_logger("App")
 
         self.logger.info("Loading modules...")
-        self.conf = Configuration()
-        self.language_detector = LanguageDetector()
+        with startup_profile.phase("configuration"):
+            self.conf = Configuration()
+            memory.set_tracing(self.conf.trace_allocations)
+            self.conf.listen("trace_allocations", lambda _, enabled: memory.set_tracing(enabled))
+        with startup_profile.phase("language detector"):
+            self.language_detector = LanguageDetector()
+            self.language_detector.update()
+            self.settle = ImeSettleScheduler(self.language_detector, self.show_language)
+            # catches changes made without the keyboard: IME toolbar, mouse, focus switches
+            self.watcher = ImeWatcher(self.language_detector)
+            self.watcher.show_cached_on_focus = self.conf.show_cached_on_focus
+            self.conf.listen("show_cached_on_focus", lambda _, value: setattr(self.watcher, "show_cached_on_focus", value))
+            self.watcher.subscribe(self.settle.observe)
 
         self.logger.info("Initializing UI...")
-        self.ui = AppUI(self.conf, initial=self.language_detector.get_current_language_str())
-        self.tray = AppTray(self.conf, global_quit=self.quit)
-        self.keyboard = KeyboardMonitor()
+        with startup_profile.phase("font"):
+            register_font(build_resource("Pretendard-Regular.otf"))
+        with startup_profile.phase("ui"):
+            self.ui = AppUI(self.conf, initial=self.language_detector.get_current_language_str())
+        # the tray icon and menu are built on the tray thread once the app is running
+        self.tray = AppTray(self.conf, global_quit=lambda: self.ui.commands.post("quit", self.quit), save_trace=self.save_trace)
 
         self.logger.info("Registering hooks...")
-        self.keyboard.register_hooks(
-            (c.K_ALT, self.hangeul_handler),
-            (c.K_HANGEUL, self.hangeul_handler),
-        )
+        with startup_profile.phase("keyboard"):
+            self.keyboard = KeyboardMonitor()
+            self.key_logger = KeyPressLogger(self.keyboard, self.conf.key_log_mode)
+            self.conf.listen("key_log_mode", lambda _, mode: self.key_logger.set_mode(mode))
+            self.trace_recorder = TraceRecorder(self.keyboard)
+            self.trace_recorder.set_recording(self.conf.record_key_trace)
+            self.conf.listen("record_key_trace", lambda _, recording: self.trace_recorder.set_recording(recording))
+            self.keyboard.coalesce_interval = self.conf.toggle_coalesce_interval
+            self.conf.listen("toggle_coalesce_interval", lambda _, interval: setattr(self.keyboard, "coalesce_interval", interval))
+            # only presses toggle the IME, and coalescing must never let a release win over a press
+            for key in (c.K_ALT, c.K_HANGEUL):
+                self.keyboard.register(key, self.hangeul_handler, ("down",), coalesce=True, accept=self.is_toggle_key)
+        self.metrics_server = None
+        if self.conf.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(self.conf.metrics_port)
+            except OSError:
+                self.logger.exception("Failed to open metrics endpoint on port %d", self.conf.metrics_port)
+        self.ipc = None
+        if ipc_name is not None:
+            self.ipc = IpcServer(ipc_name, self.language_detector, lambda: self.show_language(self.language_detector.get_current_language()))
+        self.logger.info(startup_profile.report())
     
     def quit(self):
         self.logger.info("Quitting application...")
         self.tray.quit()
         self.ui.quit()
-        self.keyboard.unregister_all()
+        self.logger.info("Keyboard handler stats: %s", self.keyboard.handler_stats())
+        self.logger.info("Keyboard input stats: %s", self.keyboard.input_stats())
+        self.keyboard.quit()
+        self.settle.quit()
+        self.watcher.quit()
+        if self.metrics_server is not None:
+            self.metrics_server.quit()
+        if self.ipc is not None:
+            self.ipc.quit()
+        self.logger.info("Window state cache: %s", self.language_detector.cache_stats())
+        self.conf.stop_watching()
+        self.conf.flush()
+        if (p50 := self.settle.settle_percentile(0.5)) is not None:
+            self.logger.info("IME settle time p50: %.1f ms, unchanged presses: %d", p50 * 1000, self.settle.unchanged)
+        shutdown_logging()
     
-    def hangeul_handler(self, e: KeyboardMonitor.Event):
+    def is_toggle_key(self, e: KeyboardMonitor.Event):
         if self.conf.ignore_left_alt and e.name in ['alt', 'left alt']: # ignoring left alt
-            self.logger.info(f"Ignoring left alt ({e.name})")
-            return
+            self.logger.debug("Ignoring left alt (%s)", e.name)
+            return False
         if self.conf.ignore_right_alt and e.name is not None and 'right' in e.name: # ignoring right alt
-            self.logger.info(f"Ignoring right alt ({e.name})")
-            return
+            self.logger.debug("Ignoring right alt (%s)", e.name)
+            return False
+        return True
+
+    def hangeul_handler(self, e: KeyboardMonitor.Event):
         if e.event_type == 'down':
-            time.sleep(0.05) # make sure ime mode is updated before calling SendMessage
-            self.language_detector.update()
-            if (key := self.language_detector.get_current_language()) is None:
-                self.logger.error("Failed to get current language (key state: %d)", self.language_detector.key_state)
-                return
-            self.ui.show_popup(key)
+            self.settle.request(e.scan_code == c.K_HANGEUL) # wait for ime mode to settle off the hook thread
+
+    def save_trace(self):
+        self.trace_recorder.save(os.path.join(LOGS_DIR, "keys.krtrace"))
+
+    def show_language(self, key: str | None):
+        if key is None:
+            self.logger.error("Failed to get current language (key state: %d)", self.language_detector.key_state)
+            return
+        if self.ipc is not None:
+            self.ipc.publish(self.language_detector.key_state)
+        # called from the settle and watcher threads, the popup itself is drawn by the Tk thread
+        self.ui.commands.post("show_popup", lambda: self.ui.show_popup(key))
 
     def run(self):
         self.logger.info("Starting application...")
+        self.watcher.start()
+        self.conf.watch()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.ipc is not None:
+            self.ipc.start()
         self.tray.run()
+        # runs once the mainloop is up, after everything that is only needed to start has been dropped
+        self.ui.commands.post("release_startup", memory.release_startup)
         self.ui.run()
 
-app = AppConductor()
-app.run()
+def main():
+    # everything above was imported after src.profiler; per-module costs: python -X importtime main.py
+    startup_profile.record("imports", startup_profile.elapsed())
+
+    # taken before any hook is installed, a second launch only asks the first one to show the popup
+    instance = acquire_instance()
+    if instance is None:
+        if hand_off("show"):
+            get_logger("App").info("Another instance is running, handed off")
+        else:
+            get_logger("App").warning("Another instance is running but did not answer")
+        shutdown_logging()
+        sys.exit(0)
+    app = AppConductor(c.IPC_NAME)
+    app.run()
+
+if __name__ == "__main__":
+    main()
+
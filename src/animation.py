@@ -0,0 +1,98 @@
+import time
+import tkinter
+from typing import Callable
+
+from src.metrics import metrics
+import src.constants as c
+
+def linear(t: float) -> float:
+    return t
+
+def ease_in_quad(t: float) -> float:
+    return t * t
+
+def ease_out_quad(t: float) -> float:
+    return t * (2 - t)
+
+def ease_in_out_cubic(t: float) -> float:
+    return 4 * t * t * t if t < 0.5 else 1 - (-2 * t + 2) ** 3 / 2
+
+EASINGS: dict[str, Callable[[float], float]] = {
+    "linear": linear,
+    "ease_in": ease_in_quad,
+    "ease_out": ease_out_quad,
+    "ease_in_out": ease_in_out_cubic,
+}
+
+class Animation:
+    type Easing = Callable[[float], float]
+    type Setter = Callable[[float], None]
+
+    def __init__(self, root: tkinter.Misc, frame_interval: int = c.ANIMATION_FRAME_INTERVAL):
+        self.root = root
+        self.frame_interval = frame_interval
+
+        self._job: str | None = None
+        self._setter: Animation.Setter | None = None
+        self._on_done: Callable[[], None] | None = None
+        self._easing: Animation.Easing = linear
+        self._start_value = 0.0
+        self._end_value = 0.0
+        self._started = 0.0
+        self._duration = 0.0
+        self._last_written: int | None = None
+        self._last_frame = 0.0
+
+        self.frame_time = metrics.histogram("animation_frame")
+        self.dropped_frames = metrics.counter("animation_dropped_frames")
+
+    @property
+    def running(self):
+        return self._job is not None
+
+    def start(self, duration: float, start: float, end: float, setter: Setter, easing: Easing = linear, on_done: Callable[[], None] | None = None):
+        self.cancel()
+        self._setter = setter
+        self._on_done = on_done
+        self._easing = easing
+        self._start_value = start
+        self._end_value = end
+        self._duration = duration
+        self._last_written = None
+        self._started = self._last_frame = time.monotonic()
+        self._tick()
+
+    def cancel(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        now = time.monotonic()
+        if (gap := now - self._last_frame) > 0:
+            self.frame_time.observe(gap)
+            # a frame is dropped for every full interval beyond the expected one
+            if (late := int(gap * 1000 / self.frame_interval) - 1) > 0:
+                self.dropped_frames.inc(late)
+        self._last_frame = now
+
+        progress = (now - self._started) / self._duration if self._duration > 0 else 1.0
+        if progress >= 1.0:
+            self._write(self._end_value, force=True)
+            self._job = None
+            if self._on_done is not None:
+                self._on_done()
+            return
+
+        value = self._start_value + (self._end_value - self._start_value) * self._easing(progress)
+        self._write(value)
+        self._job = self.root.after(self.frame_interval, self._tick)
+
+    def _write(self, value: float, force: bool = False):
+        # window alpha is stored as a byte, so smaller changes are invisible
+        quantized = round(value * c.ALPHA_LEVELS)
+        if quantized == self._last_written and not force:
+            return
+        self._last_written = quantized
+        assert self._setter is not None
+        self._setter(value)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+from src.backends.base import Backend
+from src.logger import get_logger
+
+_backend: Backend | None = None
+
+def use(backend: Backend):
+    # must run before anything imports src.cpp, which binds the backend at import time
+    global _backend
+    if _backend is not None and _backend is not backend:
+        raise RuntimeError(f"backend already resolved to {_backend.name}")
+    _backend = backend
+
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        # KRT_BACKEND=simulated runs the whole pipeline on any OS, e.g. for profiling
+        name = os.environ.get("KRT_BACKEND")
+        if name is None:
+            name = "win32" if sys.platform == "win32" else "simulated"
+            if name == "simulated":
+                # the app runs but sees a scripted desktop: no real IME state, no real key toggles
+                get_logger("Backend").warning("No Win32 on %s, falling back to the simulated backend (set KRT_BACKEND=simulated to silence this)", sys.platform)
+        if name == "win32":
+            from src.backends.win32 import Win32Backend
+            _backend = Win32Backend()
+        elif name == "simulated":
+            from src.backends.simulated import SimulatedBackend
+            _backend = SimulatedBackend()
+        else:
+            raise ValueError(f"unknown backend {name!r}")
+    return _backend
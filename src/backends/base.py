@@ -0,0 +1,111 @@
+import abc
+import asyncio
+from typing import Awaitable, Callable
+
+class Backend(abc.ABC):
+    type Rect = tuple[int, int, int, int]
+    type WinEventCallback = Callable[[int, int, int, int], None] # event, hwnd, object id, child id
+    type ClientConnected = Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]
+
+    name = "base"
+
+    # IME and windows
+    @abc.abstractmethod
+    def ime_conversion_mode(self, hwnd: int) -> int | None:
+        # None when the window did not answer
+        ...
+
+    @abc.abstractmethod
+    def foreground_window(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def caret_rect(self) -> Rect | None:
+        ...
+
+    @abc.abstractmethod
+    def is_window(self, hwnd: int) -> bool:
+        ...
+
+    # cursor and monitors
+    @abc.abstractmethod
+    def cursor_pos(self) -> tuple[int, int]:
+        ...
+
+    @abc.abstractmethod
+    def monitor_from_point(self, x: int, y: int) -> int:
+        ...
+
+    @abc.abstractmethod
+    def monitor_from_window(self, hwnd: int) -> int:
+        ...
+
+    @abc.abstractmethod
+    def monitor_rect(self, hmonitor: int) -> Rect:
+        ...
+
+    @abc.abstractmethod
+    def monitors(self) -> tuple[int, ...]:
+        ...
+
+    @abc.abstractmethod
+    def display_signature(self) -> tuple[int, ...]:
+        ...
+
+    # WinEvent hooks and the message loop that delivers them
+    @abc.abstractmethod
+    def current_thread_id(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def hook_win_events(self, callback: WinEventCallback, ranges: tuple[tuple[int, int], ...]) -> list:
+        ...
+
+    @abc.abstractmethod
+    def unhook_win_events(self, hooks: list):
+        ...
+
+    @abc.abstractmethod
+    def pump_messages(self, timeout_ms: int) -> bool:
+        # waits up to timeout_ms and dispatches whatever arrived, False once the loop was asked to quit
+        ...
+
+    @abc.abstractmethod
+    def post_quit(self, thread_id: int):
+        ...
+
+    # single-instance lock and the local IPC endpoint, both scoped to the current user and session
+    @abc.abstractmethod
+    def acquire_instance(self, name: str) -> object | None:
+        # keep the result alive for the life of the process, None when another instance holds the lock
+        ...
+
+    @abc.abstractmethod
+    def ipc_address(self, name: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    async def start_ipc_server(self, name: str, client_connected: ClientConnected, limit: int) -> asyncio.AbstractServer:
+        ...
+
+    @abc.abstractmethod
+    def ipc_request(self, name: str, line: bytes, timeout: float) -> bytes:
+        # sends one request line and returns the reply line, OSError when nothing answers
+        ...
+
+    # process
+    @abc.abstractmethod
+    def idle_time(self) -> float:
+        ...
+
+    @abc.abstractmethod
+    def register_font(self, path: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def process_memory(self) -> dict[str, int]:
+        ...
+
+    @abc.abstractmethod
+    def trim_working_set(self):
+        ...
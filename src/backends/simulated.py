@@ -0,0 +1,188 @@
+import asyncio
+import queue
+import socket
+import threading
+import time
+
+from src.backends.base import Backend
+import src.constants as c
+
+MONITOR_BASE = 0x10001
+
+def spin(seconds: float):
+    # sleep() is far too coarse for sub-millisecond syscall latencies
+    if seconds <= 0:
+        return
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+# scriptable stand-in for the desktop the app reads: IME conversion mode, foreground window, caret,
+# cursor and monitors. latency maps a method name to the seconds each call should take.
+class SimulatedBackend(Backend):
+    name = "simulated"
+
+    def __init__(self, ime_settle_delay: float = 0.005, latency: dict[str, float] | None = None,
+                 monitors: tuple[Backend.Rect, ...] = ((0, 0, 1920, 1080),)):
+        self.ime_settle_delay = ime_settle_delay
+        self.latency = latency or {}
+        self.monitor_rects = list(monitors)
+
+        self.mode = c.ENGLISH_MODE
+        self.pending_toggle_at: float | None = None
+        self.foreground = 0x1000
+        self.closed: set[int] = set()
+        self.cursor = (10, 10)
+        self.caret: Backend.Rect | None = None # screen rect, None when the focused window has no caret
+        self.last_input = time.monotonic()
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # in-process stand-ins for the instance lock and the pipe: a lock name set and loopback ports
+        self.instances: set[str] = set()
+        self.ipc_ports: dict[str, int] = {}
+
+        self._messages: queue.SimpleQueue = queue.SimpleQueue()
+        self._event_callbacks: dict[int, tuple[Backend.WinEventCallback, tuple[tuple[int, int], ...]]] = {}
+
+    def _call(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        spin(self.latency.get(name, 0.0))
+
+    # scripting
+    def press_toggle(self):
+        # the IME flips some time after the key press reaches it, like the real thing
+        with self._lock:
+            self._apply_pending()
+            self.pending_toggle_at = time.perf_counter() + self.ime_settle_delay
+        self.last_input = time.monotonic()
+
+    def _apply_pending(self):
+        if self.pending_toggle_at is not None and time.perf_counter() >= self.pending_toggle_at:
+            self.mode = c.KOREAN_MODE if self.mode == c.ENGLISH_MODE else c.ENGLISH_MODE
+            self.pending_toggle_at = None
+
+    def switch_foreground(self, hwnd: int):
+        self.foreground = hwnd
+        self.fire_event(c.EVENT_SYSTEM_FOREGROUND, hwnd)
+
+    def close_window(self, hwnd: int):
+        self.closed.add(hwnd)
+
+    def fire_event(self, event: int, hwnd: int, id_object: int = c.OBJID_WINDOW, id_child: int = 0):
+        # delivered on the thread running pump_messages, like an out-of-context WinEvent
+        self._messages.put((event, hwnd, id_object, id_child))
+
+    # Backend
+    def ime_conversion_mode(self, hwnd: int) -> int | None:
+        self._call("ime_conversion_mode")
+        with self._lock:
+            self._apply_pending()
+            return self.mode
+
+    def foreground_window(self) -> int:
+        self._call("foreground_window")
+        return self.foreground
+
+    def is_window(self, hwnd: int) -> bool:
+        self._call("is_window")
+        return hwnd not in self.closed
+
+    def caret_rect(self) -> Backend.Rect | None:
+        self._call("caret_rect")
+        return self.caret
+
+    def cursor_pos(self) -> tuple[int, int]:
+        self._call("cursor_pos")
+        return self.cursor
+
+    def _monitor_at(self, x: int, y: int) -> int:
+        for index, (left, top, right, bottom) in enumerate(self.monitor_rects):
+            if left <= x < right and top <= y < bottom:
+                return MONITOR_BASE + index
+        return MONITOR_BASE
+
+    def monitor_from_point(self, x: int, y: int) -> int:
+        self._call("monitor_from_point")
+        return self._monitor_at(x, y)
+
+    def monitor_from_window(self, hwnd: int) -> int:
+        self._call("monitor_from_window")
+        return self._monitor_at(*self.cursor) # the foreground window follows the cursor here
+
+    def monitor_rect(self, hmonitor: int) -> Backend.Rect:
+        self._call("monitor_rect")
+        return self.monitor_rects[hmonitor - MONITOR_BASE]
+
+    def monitors(self) -> tuple[int, ...]:
+        self._call("monitors")
+        return tuple(MONITOR_BASE + index for index in range(len(self.monitor_rects)))
+
+    def display_signature(self) -> tuple[int, ...]:
+        return (len(self.monitor_rects), *(value for rect in self.monitor_rects for value in rect))
+
+    def current_thread_id(self) -> int:
+        return threading.get_native_id()
+
+    def hook_win_events(self, callback: Backend.WinEventCallback, ranges: tuple[tuple[int, int], ...]) -> list:
+        hooks = [id(callback)]
+        self._event_callbacks[hooks[0]] = (callback, ranges)
+        return hooks
+
+    def unhook_win_events(self, hooks: list):
+        for hook in hooks:
+            self._event_callbacks.pop(hook, None)
+
+    def pump_messages(self, timeout_ms: int) -> bool:
+        try:
+            message = self._messages.get(timeout=timeout_ms / 1000)
+        except queue.Empty:
+            return True
+        while True:
+            if message is None:
+                return False
+            event = message[0]
+            for callback, ranges in list(self._event_callbacks.values()):
+                if any(event_min <= event <= event_max for event_min, event_max in ranges):
+                    callback(*message)
+            try:
+                message = self._messages.get_nowait()
+            except queue.Empty:
+                return True
+
+    def post_quit(self, thread_id: int):
+        self._messages.put(None)
+
+    def acquire_instance(self, name: str) -> object | None:
+        with self._lock:
+            if name in self.instances:
+                return None
+            self.instances.add(name)
+            return name
+
+    def ipc_address(self, name: str) -> str:
+        return f"127.0.0.1:{self.ipc_ports.get(name, 0)}"
+
+    async def start_ipc_server(self, name: str, client_connected: Backend.ClientConnected, limit: int) -> asyncio.AbstractServer:
+        server = await asyncio.start_server(client_connected, "127.0.0.1", 0, limit=limit)
+        self.ipc_ports[name] = server.sockets[0].getsockname()[1]
+        return server
+
+    def ipc_request(self, name: str, line: bytes, timeout: float) -> bytes:
+        if (port := self.ipc_ports.get(name)) is None:
+            raise ConnectionRefusedError(f"nothing serves {name}")
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+            sock.sendall(line)
+            return sock.makefile("rb").readline()
+
+    def idle_time(self) -> float:
+        return time.monotonic() - self.last_input
+
+    def register_font(self, path: str) -> bool:
+        return True
+
+    def process_memory(self) -> dict[str, int]:
+        return {} # no numbers to report for a simulated process
+
+    def trim_working_set(self):
+        pass
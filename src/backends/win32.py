@@ -0,0 +1,352 @@
+import asyncio
+import ctypes
+import ctypes.wintypes
+import os
+from asyncio import windows_utils
+
+from src.backends.base import Backend
+import src.constants as c
+
+class MONITORINFO(ctypes.Structure):
+    _fields_ = [
+        ("cbSize", ctypes.wintypes.DWORD),
+        ("rcMonitor", ctypes.wintypes.RECT),
+        ("rcWork", ctypes.wintypes.RECT),
+        ("dwFlags", ctypes.wintypes.DWORD)
+    ]
+
+class LASTINPUTINFO(ctypes.Structure):
+    _fields_ = [
+        ("cbSize", ctypes.wintypes.UINT),
+        ("dwTime", ctypes.wintypes.DWORD),
+    ]
+
+class GUITHREADINFO(ctypes.Structure):
+    _fields_ = [
+        ("cbSize", ctypes.wintypes.DWORD),
+        ("flags", ctypes.wintypes.DWORD),
+        ("hwndActive", ctypes.wintypes.HWND),
+        ("hwndFocus", ctypes.wintypes.HWND),
+        ("hwndCapture", ctypes.wintypes.HWND),
+        ("hwndMenuOwner", ctypes.wintypes.HWND),
+        ("hwndMoveSize", ctypes.wintypes.HWND),
+        ("hwndCaret", ctypes.wintypes.HWND),
+        ("rcCaret", ctypes.wintypes.RECT),
+    ]
+
+class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.wintypes.DWORD),
+        ("PageFaultCount", ctypes.wintypes.DWORD),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+class SECURITY_ATTRIBUTES(ctypes.Structure):
+    _fields_ = [
+        ("nLength", ctypes.wintypes.DWORD),
+        ("lpSecurityDescriptor", ctypes.c_void_p),
+        ("bInheritHandle", ctypes.wintypes.BOOL),
+    ]
+
+class SID_AND_ATTRIBUTES(ctypes.Structure):
+    _fields_ = [
+        ("Sid", ctypes.c_void_p),
+        ("Attributes", ctypes.wintypes.DWORD),
+    ]
+
+WINEVENTPROC = ctypes.WINFUNCTYPE(
+    None,
+    ctypes.wintypes.HANDLE,
+    ctypes.wintypes.DWORD,
+    ctypes.wintypes.HWND,
+    ctypes.wintypes.LONG,
+    ctypes.wintypes.LONG,
+    ctypes.wintypes.DWORD,
+    ctypes.wintypes.DWORD,
+)
+
+MONITORENUMPROC = ctypes.WINFUNCTYPE(
+    ctypes.wintypes.BOOL,
+    ctypes.wintypes.HMONITOR,
+    ctypes.wintypes.HDC,
+    ctypes.POINTER(ctypes.wintypes.RECT),
+    ctypes.wintypes.LPARAM,
+)
+
+user32 = ctypes.windll.user32
+imm32 = ctypes.windll.imm32
+gdi32 = ctypes.windll.gdi32
+psapi = ctypes.windll.psapi
+# ctypes may clobber GetLastError between two foreign calls, these keep a per-thread copy for get_last_error()
+kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+
+# handles come back as pointer-sized values, the default int return type would truncate them
+for function in (kernel32.CreateMutexW, kernel32.CreateNamedPipeW, kernel32.CreateFileW):
+    function.restype = ctypes.wintypes.HANDLE
+
+CURRENT_PROCESS = ctypes.wintypes.HANDLE(-1) # what GetCurrentProcess() returns, without the call or the int truncation
+INVALID_HANDLE_VALUE = ctypes.wintypes.HANDLE(-1).value
+
+def user_sid() -> str:
+    token = ctypes.wintypes.HANDLE()
+    if not advapi32.OpenProcessToken(CURRENT_PROCESS, c.TOKEN_QUERY, ctypes.byref(token)):
+        raise ctypes.WinError(ctypes.get_last_error())
+    try:
+        size = ctypes.wintypes.DWORD()
+        advapi32.GetTokenInformation(token, c.TOKEN_USER, None, 0, ctypes.byref(size))
+        buffer = ctypes.create_string_buffer(size.value)
+        if not advapi32.GetTokenInformation(token, c.TOKEN_USER, buffer, size, ctypes.byref(size)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        sid = ctypes.wintypes.LPWSTR()
+        if not advapi32.ConvertSidToStringSidW(ctypes.c_void_p(SID_AND_ATTRIBUTES.from_buffer(buffer).Sid), ctypes.byref(sid)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            return sid.value
+        finally:
+            kernel32.LocalFree(sid)
+    finally:
+        kernel32.CloseHandle(token)
+
+class PipeServer(asyncio.AbstractServer):
+    # asyncio's own pipe server cannot take a security descriptor: create the instances here and hand each
+    # one to the proactor the way ProactorEventLoop.start_serving_pipe does
+    def __init__(self, address: str, sid: str, client_connected: Backend.ClientConnected, limit: int):
+        self.loop = asyncio.get_running_loop()
+        self.address = address
+        self.client_connected = client_connected
+        self.limit = limit
+
+        # protected DACL with a single entry: only this user, and only from this machine (see the pipe mode)
+        self._descriptor = ctypes.c_void_p()
+        if not advapi32.ConvertStringSecurityDescriptorToSecurityDescriptorW(
+                f"D:P(A;;GA;;;{sid})", c.SDDL_REVISION_1, ctypes.byref(self._descriptor), None):
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._security = SECURITY_ATTRIBUTES(ctypes.sizeof(SECURITY_ATTRIBUTES), self._descriptor, False)
+
+        # the first instance fails if anyone else already owns the name
+        self._pipe: windows_utils.PipeHandle | None = self._create(first=True)
+        self._task = self.loop.create_task(self._accept())
+
+    def _create(self, first: bool) -> windows_utils.PipeHandle:
+        handle = kernel32.CreateNamedPipeW(
+            self.address,
+            c.PIPE_ACCESS_DUPLEX | c.FILE_FLAG_OVERLAPPED | (c.FILE_FLAG_FIRST_PIPE_INSTANCE if first else 0),
+            c.PIPE_TYPE_BYTE | c.PIPE_READMODE_BYTE | c.PIPE_WAIT | c.PIPE_REJECT_REMOTE_CLIENTS,
+            c.PIPE_UNLIMITED_INSTANCES, c.IPC_PIPE_BUFFER, c.IPC_PIPE_BUFFER, 0, ctypes.byref(self._security))
+        if handle in (None, INVALID_HANDLE_VALUE):
+            raise ctypes.WinError(ctypes.get_last_error())
+        return windows_utils.PipeHandle(handle)
+
+    async def _accept(self):
+        try:
+            while True:
+                try:
+                    await self.loop._proactor.accept_pipe(self._pipe)
+                except OSError: # the client left before the connection completed
+                    self._pipe.close()
+                    self._pipe = self._create(first=False)
+                    continue
+                pipe, self._pipe = self._pipe, self._create(first=False)
+                reader = asyncio.StreamReader(limit=self.limit)
+                protocol = asyncio.StreamReaderProtocol(reader, self.client_connected)
+                self.loop._make_duplex_pipe_transport(pipe, protocol, extra={"addr": self.address})
+        finally:
+            if self._pipe is not None:
+                self._pipe.close()
+                self._pipe = None
+
+    def close(self):
+        self._task.cancel()
+        if self._descriptor:
+            kernel32.LocalFree(self._descriptor)
+            self._descriptor = ctypes.c_void_p()
+
+    def get_loop(self):
+        return self.loop
+
+    def is_serving(self):
+        return not self._task.done()
+
+    async def wait_closed(self):
+        await asyncio.gather(self._task, return_exceptions=True)
+
+class Win32Backend(Backend):
+    name = "win32"
+
+    def __init__(self):
+        # ctypes callbacks are freed together with their Python object, keep them alive while hooked
+        self._event_procs: dict[int, WINEVENTPROC] = {}
+        self._sid: str | None = None
+
+    def ime_conversion_mode(self, hwnd: int) -> int | None:
+        hIMEWnd = imm32.ImmGetDefaultIMEWnd(hwnd)
+        # a plain SendMessage blocks the calling thread for as long as the target window is hung
+        result = ctypes.c_size_t()
+        if not user32.SendMessageTimeoutW(hIMEWnd, c.WM_IME_CONTROL, c.IMC_GETCONVERSIONMODE, 0,
+                                          c.SMTO_ABORTIFHUNG, c.IME_QUERY_TIMEOUT, ctypes.byref(result)):
+            return None
+        return result.value
+
+    def foreground_window(self) -> int:
+        return user32.GetForegroundWindow()
+
+    def is_window(self, hwnd: int) -> bool:
+        return bool(user32.IsWindow(hwnd))
+
+    def caret_rect(self) -> Backend.Rect | None:
+        # only windows that use the system caret report one (most Win32 and WinForms editors, not every browser)
+        info = GUITHREADINFO()
+        info.cbSize = ctypes.sizeof(GUITHREADINFO)
+        if not user32.GetGUIThreadInfo(0, ctypes.byref(info)) or not info.hwndCaret:
+            return None
+        caret = info.rcCaret
+        origin = ctypes.wintypes.POINT(caret.left, caret.top)
+        user32.ClientToScreen(info.hwndCaret, ctypes.byref(origin))
+        return (origin.x, origin.y, origin.x + caret.right - caret.left, origin.y + caret.bottom - caret.top)
+
+    def cursor_pos(self) -> tuple[int, int]:
+        cursor_pos = ctypes.wintypes.POINT()
+        user32.GetCursorPos(ctypes.byref(cursor_pos))
+        return (cursor_pos.x, cursor_pos.y)
+
+    def monitor_from_point(self, x: int, y: int) -> int:
+        return user32.MonitorFromPoint(ctypes.wintypes.POINT(x, y), c.MONITOR_DEFAULTTONEAREST)
+
+    def monitor_from_window(self, hwnd: int) -> int:
+        return user32.MonitorFromWindow(hwnd, c.MONITOR_DEFAULTTONEAREST)
+
+    def monitor_rect(self, hmonitor: int) -> Backend.Rect:
+        minfo = MONITORINFO()
+        minfo.cbSize = ctypes.sizeof(MONITORINFO)
+        user32.GetMonitorInfoW(hmonitor, ctypes.byref(minfo))
+        return (minfo.rcMonitor.left, minfo.rcMonitor.top, minfo.rcMonitor.right, minfo.rcMonitor.bottom)
+
+    def monitors(self) -> tuple[int, ...]:
+        hmonitors: list[int] = []
+        def collect(hmonitor, hdc, rect, lparam):
+            hmonitors.append(hmonitor)
+            return True
+        user32.EnumDisplayMonitors(None, None, MONITORENUMPROC(collect), 0)
+        return tuple(hmonitors)
+
+    def display_signature(self) -> tuple[int, ...]:
+        # every monitor's handle and rect: a resolution change or realignment inside the same virtual screen
+        # bounds still changes it. one enumeration per check, no per-monitor calls
+        signature: list[int] = []
+        def collect(hmonitor, hdc, rect, lparam):
+            signature.extend((hmonitor, rect.contents.left, rect.contents.top, rect.contents.right, rect.contents.bottom))
+            return True
+        user32.EnumDisplayMonitors(None, None, MONITORENUMPROC(collect), 0)
+        return tuple(signature)
+
+    def current_thread_id(self) -> int:
+        return kernel32.GetCurrentThreadId()
+
+    def hook_win_events(self, callback: Backend.WinEventCallback, ranges: tuple[tuple[int, int], ...]) -> list:
+        proc = WINEVENTPROC(lambda hook, event, hwnd, idObject, idChild, thread, time: callback(event, hwnd or 0, idObject, idChild))
+        # out-of-context hooks are delivered through the calling thread's message queue
+        hooks = [
+            user32.SetWinEventHook(event_min, event_max, 0, proc, 0, 0, c.WINEVENT_OUTOFCONTEXT | c.WINEVENT_SKIPOWNPROCESS)
+            for event_min, event_max in ranges
+        ]
+        self._event_procs[id(hooks)] = proc
+        return hooks
+
+    def unhook_win_events(self, hooks: list):
+        for hook in hooks:
+            if hook:
+                user32.UnhookWinEvent(hook)
+        self._event_procs.pop(id(hooks), None)
+
+    def pump_messages(self, timeout_ms: int) -> bool:
+        user32.MsgWaitForMultipleObjects(0, None, False, timeout_ms, c.QS_ALLINPUT)
+        msg = ctypes.wintypes.MSG()
+        while user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, c.PM_REMOVE):
+            if msg.message == c.WM_QUIT:
+                return False
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+        return True
+
+    def post_quit(self, thread_id: int):
+        user32.PostThreadMessageW(thread_id, c.WM_QUIT, 0, 0)
+
+    def _scope(self) -> str:
+        if self._sid is None:
+            self._sid = user_sid()
+        return self._sid
+
+    def acquire_instance(self, name: str) -> object | None:
+        # the Local namespace is per session, the SID keeps users sharing a session apart (runas)
+        handle = kernel32.CreateMutexW(None, False, f"Local\\{name}-{self._scope()}")
+        if not handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+        if ctypes.get_last_error() == c.ERROR_ALREADY_EXISTS:
+            kernel32.CloseHandle(ctypes.wintypes.HANDLE(handle))
+            return None
+        return ctypes.wintypes.HANDLE(handle) # released by the OS when the process exits, crash included
+
+    def ipc_address(self, name: str) -> str:
+        # pipe names are machine-wide, unlike the mutex
+        session = ctypes.wintypes.DWORD()
+        kernel32.ProcessIdToSessionId(kernel32.GetCurrentProcessId(), ctypes.byref(session))
+        return f"\\\\.\\pipe\\{name}-{self._scope()}-{session.value}"
+
+    async def start_ipc_server(self, name: str, client_connected: Backend.ClientConnected, limit: int) -> asyncio.AbstractServer:
+        return PipeServer(self.ipc_address(name), self._scope(), client_connected, limit)
+
+    def ipc_request(self, name: str, line: bytes, timeout: float) -> bytes:
+        address = self.ipc_address(name)
+        if not kernel32.WaitNamedPipeW(address, int(timeout * 1000)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        handle = kernel32.CreateFileW(address, c.GENERIC_READ | c.GENERIC_WRITE, 0, None, c.OPEN_EXISTING, 0, None)
+        if handle in (None, INVALID_HANDLE_VALUE):
+            raise ctypes.WinError(ctypes.get_last_error())
+        handle = ctypes.wintypes.HANDLE(handle)
+        try:
+            done = ctypes.wintypes.DWORD()
+            if not kernel32.WriteFile(handle, line, len(line), ctypes.byref(done), None):
+                raise ctypes.WinError(ctypes.get_last_error())
+            reply = b""
+            buffer = ctypes.create_string_buffer(c.IPC_LINE_LIMIT)
+            while not reply.endswith(b"\n"):
+                if not kernel32.ReadFile(handle, buffer, len(buffer), ctypes.byref(done), None) or not done.value:
+                    break
+                reply += buffer.raw[:done.value]
+            return reply
+        finally:
+            kernel32.CloseHandle(handle)
+
+    def idle_time(self) -> float:
+        info = LASTINPUTINFO()
+        info.cbSize = ctypes.sizeof(LASTINPUTINFO)
+        if not user32.GetLastInputInfo(ctypes.byref(info)):
+            return 0.0
+        return ((kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+    def register_font(self, path: str) -> bool:
+        # process-private registration, so Tk can resolve the family without installing the font
+        return gdi32.AddFontResourceExW(os.path.abspath(path), c.FR_PRIVATE, 0) != 0
+
+    def process_memory(self) -> dict[str, int]:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+        if not psapi.GetProcessMemoryInfo(CURRENT_PROCESS, ctypes.byref(counters), counters.cb):
+            return {}
+        return {
+            "working_set": counters.WorkingSetSize,
+            "peak_working_set": counters.PeakWorkingSetSize,
+            "private": counters.PagefileUsage,
+        }
+
+    def trim_working_set(self):
+        # pages are only handed back to the OS, they fault back in if touched again
+        kernel32.SetProcessWorkingSetSize(CURRENT_PROCESS, ctypes.c_size_t(-1), ctypes.c_size_t(-1))
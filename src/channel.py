@@ -0,0 +1,83 @@
+import threading
+import time
+import tkinter
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from src.logger import get_logger
+from src.metrics import metrics
+import src.constants as c
+
+class CommandChannel:
+    type Command = Callable[[], None]
+
+    # Tk may only be touched from the thread running its mainloop: other threads post here and the
+    # mainloop drains the queue. Posting under a key that is still pending replaces that command.
+    # nothing is scheduled while the queue is empty, the post that fills it arms a single drain
+    def __init__(self, root: tkinter.Misc, max_size: int = c.COMMAND_QUEUE_SIZE):
+        self.logger = get_logger("CommandChannel")
+        self.root = root
+        self.max_size = max_size
+
+        self.depth = metrics.gauge("command_queue_depth")
+        self.latency = metrics.histogram("command_latency")
+        self.superseded = metrics.counter("commands_superseded")
+        self.dropped = metrics.counter("commands_dropped")
+
+        self.pending: OrderedDict[Hashable, tuple[float, CommandChannel.Command]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        # armed here on the Tk thread, drains whatever is posted before the mainloop starts
+        self._armed = True
+        self._job: str | None = self.root.after_idle(self.drain)
+
+    def post(self, key: Hashable, command: Command):
+        with self._lock:
+            if self._closed:
+                return
+            if self.pending.pop(key, None) is not None:
+                self.superseded.inc()
+            elif len(self.pending) >= self.max_size:
+                dropped, _ = self.pending.popitem(last=False)
+                self.dropped.inc()
+                self.logger.warning("Command queue full, dropped %s", dropped)
+            self.pending[key] = (time.perf_counter(), command)
+            self.depth.set(len(self.pending))
+            if self._armed:
+                return
+            self._armed = True
+        # threaded Tcl hands a call from another thread to the mainloop thread and waits for it there
+        try:
+            self._job = self.root.after_idle(self.drain)
+        except (RuntimeError, tkinter.TclError):
+            with self._lock:
+                self._armed = False
+            self.logger.warning("Could not wake the mainloop for %s", key)
+
+    def drain(self):
+        with self._lock:
+            commands = list(self.pending.items())
+            self.pending.clear()
+            self.depth.set(0)
+        for key, (posted, command) in commands:
+            self.latency.observe(time.perf_counter() - posted)
+            try:
+                command()
+            except Exception:
+                self.logger.exception("Command %s failed", key)
+            if self._closed:
+                return # a command closed the channel, the root is gone
+        with self._lock:
+            # posts made while the commands ran found the channel armed and are still waiting
+            if not self.pending:
+                self._armed = False
+                self._job = None
+                return
+        self._job = self.root.after_idle(self.drain)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            job, self._job = self._job, None
+        if job is not None:
+            self.root.after_cancel(job)
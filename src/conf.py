@@ -1,9 +1,15 @@
 import json
+import os
+import threading
+import time
 from typing import Literal, Callable, cast, Any
 from logging import Logger
 
 import src.constants as c
 from src.logger import get_logger
+from src.metrics import metrics
+
+CONFIG_FILE = "config.json"
 
 class Configuration:
     type FieldType = \
@@ -13,21 +19,67 @@ class Configuration:
         Literal["monitor_conf"] | \
         Literal["ignore_left_alt"] | \
         Literal["ignore_right_alt"] | \
-        Literal["initial_alpha"]
+        Literal["initial_alpha"] | \
+        Literal["key_log_mode"] | \
+        Literal["corner_radius"] | \
+        Literal["show_cached_on_focus"] | \
+        Literal["metrics_port"] | \
+        Literal["toggle_coalesce_interval"] | \
+        Literal["record_key_trace"] | \
+        Literal["idle_release_after"] | \
+        Literal["trace_allocations"]
     type ValueType = int | float | bool
-    type Listener = Callable[[ValueType], None]
-    
-    __listeners_id: int = 0
-    __listeners: dict[FieldType, list[tuple[str, Listener]]] = {}
-    _fields_: list[tuple[FieldType, ValueType]] = [
-        ("fade_duration", 0.5),
-        ("window_lifetime", 0.5),
-        ("window_size_ratio", 1/8),
-        ("monitor_conf", c.E_MONITORCONF.PRIMARY),
-        ("ignore_left_alt", True),
-        ("ignore_right_alt", False),
-        ("initial_alpha", 1.0)
+    type Listener = Callable[[ValueType, ValueType], None]
+    type Handle = int
+
+    # (name, type, default, constraint)
+    _fields_: list[tuple[FieldType, type, ValueType, Callable[[Any], bool]]] = [
+        ("fade_duration", float, 0.5, lambda v: v >= 0),
+        ("window_lifetime", float, 0.5, lambda v: v >= 0),
+        ("window_size_ratio", float, 1/8, lambda v: 0 < v <= 1),
+        ("monitor_conf", int, c.E_MONITORCONF.PRIMARY, lambda v: v in (c.E_MONITORCONF.PRIMARY, c.E_MONITORCONF.CURSOR, c.E_MONITORCONF.FOCUSED, c.E_MONITORCONF.ALL, c.E_MONITORCONF.CARET)),
+        ("ignore_left_alt", bool, True, lambda v: True),
+        ("ignore_right_alt", bool, False, lambda v: True),
+        ("initial_alpha", float, 1.0, lambda v: 0 <= v <= 1),
+        ("key_log_mode", int, c.E_KEYLOGMODE.ERROR_ONLY, lambda v: v in (c.E_KEYLOGMODE.OFF, c.E_KEYLOGMODE.ERROR_ONLY, c.E_KEYLOGMODE.ALWAYS)),
+        ("corner_radius", int, 40, lambda v: v >= 0),
+        ("show_cached_on_focus", bool, False, lambda v: True),
+        ("metrics_port", int, 0, lambda v: 0 <= v <= 65535),
+        ("toggle_coalesce_interval", float, 0.03, lambda v: 0 <= v <= 1),
+        ("record_key_trace", bool, False, lambda v: True),
+        ("idle_release_after", float, 300.0, lambda v: v >= 0),
+        ("trace_allocations", bool, False, lambda v: True),
     ]
+    _schema_ = { name: (field_type, default, check) for name, field_type, default, check in _fields_ }
+
+    __slots__ = (
+        "fade_duration",
+        "window_lifetime",
+        "window_size_ratio",
+        "monitor_conf",
+        "ignore_left_alt",
+        "ignore_right_alt",
+        "initial_alpha",
+        "key_log_mode",
+        "corner_radius",
+        "show_cached_on_focus",
+        "metrics_port",
+        "toggle_coalesce_interval",
+        "record_key_trace",
+        "idle_release_after",
+        "trace_allocations",
+        "logger",
+        "_lock",
+        "_save_cond",
+        "_save_lock",
+        "_save_due",
+        "_saver",
+        "_listeners",
+        "_listener_fields",
+        "_next_handle",
+        "_file_stat",
+        "_watching",
+    )
 
     fade_duration: float
     window_lifetime: float
@@ -36,52 +88,205 @@ class Configuration:
     ignore_left_alt: bool
     ignore_right_alt: bool
     initial_alpha: float
+    key_log_mode: c.E_KEYLOGMODE
+    corner_radius: int
+    show_cached_on_focus: bool
+    metrics_port: int
+    toggle_coalesce_interval: float
+    record_key_trace: bool
+    idle_release_after: float
+    trace_allocations: bool
 
     logger: Logger
 
     def __init__(self):
         self.__non_write_set("logger", get_logger("Configuration"))
+        self.__non_write_set("_lock", threading.Lock())
+        self.__non_write_set("_save_cond", threading.Condition(self._lock))
+        # held for the whole write, flush() takes it to wait out a save already in progress
+        self.__non_write_set("_save_lock", threading.Lock())
+        self.__non_write_set("_save_due", None)
+        self.__non_write_set("_saver", None)
+        self.__non_write_set("_listeners", {})
+        self.__non_write_set("_listener_fields", {})
+        self.__non_write_set("_next_handle", 1)
+        self.__non_write_set("_file_stat", None)
+        self.__non_write_set("_watching", threading.Event())
         self.load_from_json()
         self.logger.info("Configuration initialized")
 
+    @classmethod
+    def validate(cls, name: str, value: Any) -> ValueType:
+        if name not in cls._schema_:
+            raise KeyError(name)
+        field_type, _, check = cls._schema_[name]
+        # bool is an int subclass, never let it stand in for a number (or the other way round)
+        if isinstance(value, bool) != (field_type is bool):
+            raise TypeError(f"{name} must be {field_type.__name__}, got {type(value).__name__}")
+        if field_type is float and isinstance(value, int):
+            value = float(value)
+        if not isinstance(value, field_type):
+            raise TypeError(f"{name} must be {field_type.__name__}, got {type(value).__name__}")
+        if not check(value):
+            raise ValueError(f"{name} out of range: {value!r}")
+        return value
+
     def setproperty(self, **kwargs):
-        for field_name, default_value in self._fields_:
-            self.__non_write_set(field_name, kwargs[field_name] if field_name in kwargs else default_value)
+        for name in kwargs.keys() - self._schema_.keys():
+            self.logger.warning("Ignoring unknown configuration field %s", name)
+
+        changed = []
+        for field_name, _, default_value, _ in self._fields_:
+            old_value = getattr(self, field_name, None)
+            new_value = default_value
+            if field_name in kwargs:
+                try:
+                    new_value = self.validate(field_name, kwargs[field_name])
+                except (TypeError, ValueError) as e:
+                    new_value = default_value if old_value is None else old_value
+                    self.logger.warning("Invalid configuration value, keeping %r: %s", new_value, e)
+            if old_value == new_value and old_value is not None:
+                continue
+            self.__non_write_set(field_name, new_value)
+            if old_value is not None:
+                changed.append((field_name, old_value, new_value))
+
+        for field_name, old_value, new_value in changed:
+            self.logger.info("%s changed: %s -> %s", field_name, old_value, new_value)
+            self.__dispatch(field_name, old_value, new_value)
 
     def getproperty(self):
-        return { k: getattr(self, k) if hasattr(self, k) else v for k, v in self._fields_ }
+        return { name: getattr(self, name, default) for name, _, default, _ in self._fields_ }
 
     def load_from_json(self):
         try:
-            with open("config.json", "r") as f:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
-                self.logger.info(f"Loaded configuration from {f.name}")
-                self.setproperty(**data)
         except FileNotFoundError:
+            self.setproperty()
             self.save_to_json()
-            self.load_from_json()
-    
+            return
+        except (OSError, json.JSONDecodeError):
+            # most likely caught mid-write by a deployment tool, the next change will be picked up
+            self.logger.exception("Failed to read %s, keeping current configuration", CONFIG_FILE)
+            return
+
+        self.__non_write_set("_file_stat", self._stat())
+        if not isinstance(data, dict):
+            self.logger.error("%s must contain a JSON object", CONFIG_FILE)
+            return
+        self.logger.info("Loaded configuration from %s", CONFIG_FILE)
+        self.setproperty(**data)
+
     def save_to_json(self):
-        with open("config.json", "w") as f:
-            json.dump(self.getproperty(), f)
-            self.logger.info(f"Saved configuration to {f.name}")
+        with self._save_lock:
+            started = time.perf_counter()
+            with self._lock:
+                data = self.getproperty()
+            # write to a temporary file first so a crash never leaves a half-written config.json
+            with open(CONFIG_FILE + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(CONFIG_FILE + ".tmp", CONFIG_FILE)
+            # our own write must not look like an external change to the watcher
+            self.__non_write_set("_file_stat", self._stat())
+            metrics.histogram("config_save").observe(time.perf_counter() - started)
+        self.logger.info("Saved configuration to %s", CONFIG_FILE)
+
+    def schedule_save(self):
+        with self._save_cond:
+            self.__non_write_set("_save_due", time.monotonic() + c.CONFIG_SAVE_DELAY)
+            if self._saver is None:
+                saver = threading.Thread(target=self._save_loop, name="ConfigurationSaver", daemon=True)
+                self.__non_write_set("_saver", saver)
+                saver.start()
+            self._save_cond.notify()
+
+    def _save_loop(self):
+        # one long-lived saver, every change only moves the deadline
+        while True:
+            with self._save_cond:
+                while self._save_due is None or (remaining := self._save_due - time.monotonic()) > 0:
+                    self._save_cond.wait(None if self._save_due is None else remaining)
+                self.__non_write_set("_save_due", None)
+            try:
+                self.save_to_json()
+            except OSError:
+                self.logger.exception("Failed to save %s", CONFIG_FILE)
+
+    def pending_save(self):
+        return self._save_due is not None or self._save_lock.locked()
+
+    def flush(self):
+        with self._save_cond:
+            pending = self._save_due is not None
+            self.__non_write_set("_save_due", None)
+        if pending:
+            self.save_to_json()
+            return
+        # the saver may be writing right now, wait for it to finish
+        with self._save_lock:
+            pass
+
+    def _stat(self):
+        try:
+            st = os.stat(CONFIG_FILE)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def watch(self, interval: float = c.CONFIG_WATCH_INTERVAL):
+        if self._watching.is_set():
+            return
+        self._watching.set()
+        threading.Thread(target=self._watch, args=(interval,), name="ConfigurationWatcher", daemon=True).start()
+
+    def _watch(self, interval: float):
+        while self._watching.is_set():
+            time.sleep(interval)
+            if self.pending_save():
+                continue # a local change is about to be written, it wins over the file
+            if (stat := self._stat()) is not None and stat != self._file_stat:
+                self.logger.info("%s changed on disk, reloading", CONFIG_FILE)
+                self.load_from_json()
+
+    def stop_watching(self):
+        self._watching.clear()
 
     def __non_write_set(self, name: str, value: Any) -> None:
         object.__setattr__(self, name, value)
 
     def __setattr__(self, name: str, value: ValueType) -> None:
+        if name not in self._schema_:
+            raise AttributeError(f"Configuration has no field {name}")
+        value = self.validate(name, value)
+        old_value = getattr(self, name, None)
+        if old_value == value:
+            return
         object.__setattr__(self, name, value)
-        self.save_to_json()
-    
-    def listen(self, name: FieldType, listener: Listener):
-        if name not in self.__listeners: self.__listeners[name] = []
-        listener_id = f"{name}_{self.__listeners_id}"
-        self.__non_write_set("__listeners_id", self.__listeners_id + 1)
-        self.__listeners[name].append((listener_id, listener))
-        self.logger.info(f"Listener {listener_id} added to {name}")
-        return listener_id
-    
-    def forget(self, _id: str):
-        attrname = cast(Configuration.FieldType, '_'.join(_id.split('_')[:-1]))
-        self.__listeners[attrname] = list(filter(lambda lid: lid[0] != _id, self.__listeners[attrname]))
-        self.logger.info(f"Listener {_id} removed from {attrname}")
+        self.__dispatch(cast(Configuration.FieldType, name), old_value, value)
+        self.schedule_save()
+
+    def __dispatch(self, name: FieldType, old_value: Any, new_value: Any):
+        for handle, listener in list(self._listeners.get(name, {}).items()):
+            try:
+                listener(old_value, new_value)
+            except Exception:
+                self.logger.exception("Listener %d failed", handle)
+
+    def listen(self, name: FieldType, listener: Listener) -> Handle:
+        if name not in self._schema_:
+            raise KeyError(name)
+        handle = self._next_handle
+        self.__non_write_set("_next_handle", handle + 1)
+        self._listeners.setdefault(name, {})[handle] = listener
+        self._listener_fields[handle] = name
+        self.logger.info("Listener %d added to %s", handle, name)
+        return handle
+
+    def forget(self, handle: Handle):
+        if (name := self._listener_fields.pop(handle, None)) is None:
+            return
+        self._listeners[name].pop(handle, None)
+        self.logger.info("Listener %d removed from %s", handle, name)
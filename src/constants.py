@@ -1,17 +1,102 @@
 TRANSPARENT_COLOR = "#123456"
 BACKGROUND_COLOR = "#333333"
+POPUP_GLYPHS = ("가", "A", "?")
 
 class E_MONITORCONF:
     PRIMARY = 1
     CURSOR = 2
     FOCUSED = 3
+    ALL = 4
+    CARET = 5
+
+class E_KEYLOGMODE:
+    OFF = 0
+    ERROR_ONLY = 1
+    ALWAYS = 2
 
 IMC_GETCONVERSIONMODE = 0x0001
 MONITOR_DEFAULTTONEAREST = 0x00000002
 WM_IME_CONTROL = 643
+SMTO_ABORTIFHUNG = 0x0002
+FR_PRIVATE = 0x10
+EVENT_SYSTEM_FOREGROUND = 0x0003
+OBJID_WINDOW = 0
+EVENT_OBJECT_IME_SHOW = 0x8027
+EVENT_OBJECT_IME_CHANGE = 0x8029
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENT_SKIPOWNPROCESS = 0x0002
+QS_ALLINPUT = 0x04FF
+PM_REMOVE = 0x0001
+WM_QUIT = 0x0012
+WAIT_TIMEOUT = 0x0102
+ERROR_ALREADY_EXISTS = 183
+TOKEN_QUERY = 0x0008
+TOKEN_USER = 1
+SDDL_REVISION_1 = 1
+PIPE_ACCESS_DUPLEX = 0x00000003
+FILE_FLAG_OVERLAPPED = 0x40000000
+FILE_FLAG_FIRST_PIPE_INSTANCE = 0x00080000
+PIPE_TYPE_BYTE = 0x00000000
+PIPE_READMODE_BYTE = 0x00000000
+PIPE_WAIT = 0x00000000
+PIPE_REJECT_REMOTE_CLIENTS = 0x00000008
+PIPE_UNLIMITED_INSTANCES = 255
+GENERIC_READ = 0x80000000
+GENERIC_WRITE = 0x40000000
+OPEN_EXISTING = 3
 VK_HANGUEL = 0x15
 KOREAN_MODE = 1
 ENGLISH_MODE = 0
 
 K_ALT = 56
-K_HANGEUL = 242
\ No newline at end of file
+K_HANGEUL = 242
+K_HANJA = 241
+# Korean keyboards send these without a break code, so every 'down' is a real press
+MAKE_ONLY_KEYS = frozenset((K_HANGEUL, K_HANJA))
+
+IME_SETTLE_STABLE = 0.03 # minimum seconds without a change before an Alt press counts as not toggling
+IME_SETTLE_STABLE_FACTOR = 3 # times the p95 settle time, for slow IMEs
+IME_SETTLE_TOGGLE_DEADLINE = 0.25 # seconds to wait for a Hangul key press to land
+IME_SETTLE_FIRST_DELAY = 0.002
+IME_SETTLE_MAX_DELAY = 0.016
+IME_SETTLE_HISTORY = 256
+IME_QUERY_TIMEOUT = 50 # ms a window gets to answer the conversion mode query
+
+ANIMATION_FRAME_INTERVAL = 16 # ms
+ALPHA_LEVELS = 255
+
+CONFIG_SAVE_DELAY = 0.5 # seconds of quiet before a pending change is written
+CONFIG_WATCH_INTERVAL = 1.0
+
+DISPLAY_CHECK_INTERVAL = 2000 # ms
+
+COMMAND_QUEUE_SIZE = 32
+
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+KEY_LOG_RING_SIZE = 200
+TRACE_CAPACITY = 65536 # events, 15 bytes each
+
+POPUP_BOTTOM_PADDING = 50 # px
+CARET_SAMPLE_INTERVAL = 33 # ms, only while the popup is visible
+CARET_MOVE_THRESHOLD = 4 # px, smaller moves keep the current geometry
+CARET_OFFSET = 8 # px between the caret and the popup
+
+SURFACE_CACHE_SIZE = 6 # per popup window
+TRAY_ICON_SIZE = 64
+
+TRACEMALLOC_FRAMES = 1
+TRACEMALLOC_TOP = 10
+
+IME_WATCH_MIN_INTERVAL = 0.1
+IME_WATCH_MAX_INTERVAL = 2.0
+IME_WATCH_IDLE_AFTER = 5.0 # seconds without input before polling starts to back off
+WINDOW_STATE_CACHE_SIZE = 64
+
+IPC_NAME = "KoreanToaster" # scoped to the user and session by the backend, e.g. \\.\pipe\KoreanToaster-<sid>-<session>
+IPC_PIPE_BUFFER = 4096
+IPC_HANDOFF_TIMEOUT = 2.0
+IPC_LINE_LIMIT = 4096 # bytes per request line
+IPC_MAX_BUFFER = 64 * 1024 # unsent bytes before a subscriber is dropped
+
+METRICS_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
@@ -1,31 +1,96 @@
-import ctypes
-import ctypes.wintypes
+import threading
+import time
+from collections import OrderedDict
 
 import src.constants as c
+from src.backends import get_backend
 from src.logger import get_logger
+from src.metrics import metrics
 
-class MONITORINFO(ctypes.Structure):
-    _fields_ = [
-        ("cbSize", ctypes.wintypes.DWORD),
-        ("rcMonitor", ctypes.wintypes.RECT),
-        ("rcWork", ctypes.wintypes.RECT),
-        ("dwFlags", ctypes.wintypes.DWORD)
-    ]
+# resolved once here, every call below goes straight to the platform implementation
+backend = get_backend()
 
-user32 = ctypes.windll.user32
-imm32 = ctypes.windll.imm32
+register_font_logger = get_logger("register_font")
+def register_font(path: str):
+    if not backend.register_font(path):
+        register_font_logger.error("Failed to register font %s", path)
 
 class LanguageDetector:
-    def __init__(self):
+    def __init__(self, cache_size: int = c.WINDOW_STATE_CACHE_SIZE):
         self.logger = get_logger("LanguageDetector")
         self.key_state = 0
+        self.query_time = metrics.histogram("ime_query")
+
+        # windows keeps a conversion mode per window, remember the last one seen for each
+        self.window_states: OrderedDict[int, int] = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def query(self, hWnd: int | None = None) -> int:
+        started = time.perf_counter()
+        if hWnd is None:
+            hWnd = backend.foreground_window()
+        state = backend.ime_conversion_mode(hWnd)
+        self.query_time.observe(time.perf_counter() - started)
+        if state is None:
+            # the window did not answer in time (hung or busy), keep what we had rather than guessing
+            return self.key_state
+        self.remember(hWnd, state)
+        return state
+
+    def commit(self, state: int) -> bool:
+        # settle and watcher threads both observe changes, only the one that flips key_state publishes it
+        with self._lock:
+            if state == self.key_state:
+                return False
+            self.key_state = state
+            return True
+
+    def remember(self, hWnd: int, state: int):
+        if not hWnd:
+            return
+        with self._lock:
+            self.window_states[hWnd] = state
+            self.window_states.move_to_end(hWnd)
+            while len(self.window_states) > self.cache_size:
+                self.window_states.popitem(last=False)
+
+    def cached_state(self, hWnd: int) -> int | None:
+        with self._lock:
+            if (state := self.window_states.get(hWnd)) is None:
+                self.misses += 1
+                return None
+            self.window_states.move_to_end(hWnd)
+            self.hits += 1
+            return state
+
+    def forget_window(self, hWnd: int):
+        with self._lock:
+            self.window_states.pop(hWnd, None)
+
+    def prune_windows(self):
+        # cheaper than hooking every window destruction on the desktop; at most cache_size IsWindow calls
+        with self._lock:
+            hWnds = list(self.window_states)
+        for hWnd in hWnds:
+            if not backend.is_window(hWnd):
+                self.forget_window(hWnd)
+
+    def cache_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "windows": len(self.window_states),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
 
     def update(self):
-        hWnd = user32.GetForegroundWindow()
-        hIMEWnd = imm32.ImmGetDefaultIMEWnd(hWnd)
-        conversion_status = user32.SendMessageW(hIMEWnd, c.WM_IME_CONTROL, c.IMC_GETCONVERSIONMODE, 0)
-        self.key_state = conversion_status
-        self.logger.info(f"Key state: {self.key_state}")
+        self.key_state = self.query()
+        self.logger.debug("Key state: %d", self.key_state)
     def is_hangul(self):
         return self.key_state == c.KOREAN_MODE
     def is_english(self):
@@ -36,31 +101,91 @@ class LanguageDetector:
         return result if (result := self.get_current_language()) is not None else '?'
 
 
+class MonitorTopology:
+    type Rect = tuple[int, int, int, int]
+
+    def __init__(self):
+        self.logger = get_logger("MonitorTopology")
+        self.rects: dict[int, MonitorTopology.Rect] = {}
+        self.all_rects: tuple[MonitorTopology.Rect, ...] | None = None
+        self.signature = self.display_signature()
+
+    def display_signature(self):
+        return backend.display_signature()
+
+    def check(self):
+        # cheap poll for display configuration changes (monitor added/removed, any monitor's resolution or position)
+        if (signature := self.display_signature()) == self.signature:
+            return False
+        self.signature = signature
+        self.invalidate()
+        return True
+
+    def invalidate(self):
+        self.rects.clear()
+        self.all_rects = None
+        self.logger.info("Display configuration changed, monitor cache cleared")
+
+    def rect(self, hmonitor: int) -> Rect:
+        if (cached := self.rects.get(hmonitor)) is not None:
+            return cached
+
+        rect = self.rects[hmonitor] = backend.monitor_rect(hmonitor)
+        self.logger.info("Monitor %d rect: %s", hmonitor, rect)
+        return rect
+
+    def monitors(self) -> tuple[Rect, ...]:
+        if self.all_rects is not None:
+            return self.all_rects
+
+        self.all_rects = tuple(self.rect(hmonitor) for hmonitor in backend.monitors())
+        return self.all_rects
+
+monitor_topology = MonitorTopology()
+
+def get_all_monitor_rects():
+    return monitor_topology.monitors()
+
 get_monitor_rect_logger = get_logger("get_monitor_rect")
+get_monitor_rect_time = metrics.histogram("get_monitor_rect")
 def get_monitor_rect(by: c.E_MONITORCONF):
-    if by == c.E_MONITORCONF.PRIMARY: return [0, 0, None, None]
+    started = time.perf_counter()
+    try:
+        return _get_monitor_rect(by)
+    finally:
+        get_monitor_rect_time.observe(time.perf_counter() - started)
 
-    minfo = MONITORINFO()
-    minfo.cbSize = ctypes.sizeof(MONITORINFO)
+def _get_monitor_rect(by: c.E_MONITORCONF):
+    if by == c.E_MONITORCONF.PRIMARY: return (0, 0, None, None)
 
     hmonitor = None
     if by == c.E_MONITORCONF.CURSOR:
-        cursor_pos = ctypes.wintypes.POINT()
-        user32.GetCursorPos(ctypes.byref(cursor_pos))
-        hmonitor = user32.MonitorFromPoint(cursor_pos, c.MONITOR_DEFAULTTONEAREST)
+        hmonitor = backend.monitor_from_point(*backend.cursor_pos())
     elif by == c.E_MONITORCONF.FOCUSED:
-        hwnd = user32.GetForegroundWindow()
-        hmonitor = user32.MonitorFromWindow(hwnd, c.MONITOR_DEFAULTTONEAREST)
+        hmonitor = backend.monitor_from_window(backend.foreground_window())
     
-    if hmonitor is None:
+    if not hmonitor:
         get_monitor_rect_logger.error("Failed to get monitor handle")
-        return [0, 0, None, None]
+        return (0, 0, None, None)
     
-    user32.GetMonitorInfoW(hmonitor, ctypes.byref(minfo))
-    get_monitor_rect_logger.info(f"Monitor rect: [{minfo.rcMonitor.left}, {minfo.rcMonitor.top}, {minfo.rcMonitor.right}, {minfo.rcMonitor.bottom}]")
-    return [
-        minfo.rcMonitor.left,
-        minfo.rcMonitor.top,
-        minfo.rcMonitor.right,
-        minfo.rcMonitor.bottom,
-    ]
+    return monitor_topology.rect(hmonitor)
+
+def get_monitor_rect_at(x: int, y: int):
+    return monitor_topology.rect(backend.monitor_from_point(x, y))
+
+get_caret_rect_time = metrics.histogram("caret_query")
+def get_caret_rect() -> MonitorTopology.Rect | None:
+    started = time.perf_counter()
+    try:
+        return backend.caret_rect()
+    finally:
+        get_caret_rect_time.observe(time.perf_counter() - started)
+
+def get_idle_time() -> float:
+    return backend.idle_time()
+
+def get_process_memory() -> dict[str, int]:
+    return backend.process_memory()
+
+def trim_working_set():
+    backend.trim_working_set()
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+from typing import Callable
+
+from src.cpp import LanguageDetector, backend
+from src.logger import get_logger
+from src.metrics import metrics
+import src.constants as c
+
+# line-delimited JSON over a named pipe only the current user can open, one object per line each way:
+#   {"cmd": "get"}        -> {"state": 1, "language": "가"}
+#   {"cmd": "subscribe"}  -> the current state, then one line per change until the client disconnects
+#   {"cmd": "show"}       -> {"ok": true}, shows the popup (what a second launch sends before exiting)
+
+def acquire_instance(name: str = c.IPC_NAME) -> object | None:
+    # a named mutex per user and session, the OS releases it even after a crash
+    return backend.acquire_instance(name)
+
+def hand_off(command: str = "show", name: str = c.IPC_NAME) -> bool:
+    request = json.dumps({ "cmd": command }).encode("utf-8") + b"\n"
+    replies: list[bytes] = []
+    def send():
+        try:
+            replies.append(backend.ipc_request(name, request, c.IPC_HANDOFF_TIMEOUT))
+        except OSError:
+            pass
+    # a blocking pipe read has no timeout of its own, don't let a hung instance hang this one too
+    thread = threading.Thread(target=send, name="IpcHandOff", daemon=True)
+    thread.start()
+    thread.join(c.IPC_HANDOFF_TIMEOUT)
+    try:
+        return bool(replies) and json.loads(replies[0]).get("ok") is True
+    except (ValueError, AttributeError):
+        return False
+
+class IpcServer:
+    def __init__(self, name: str, detector: LanguageDetector, show: Callable[[], None]):
+        self.logger = get_logger("IpcServer")
+        self.name = name
+        self.detector = detector
+        self.show = show
+
+        self.clients = metrics.gauge("ipc_clients")
+        self.requests = metrics.counter("ipc_requests")
+        self.subscribers: set[asyncio.StreamWriter] = set()
+        self.published = detector.key_state
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="IpcServer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def quit(self):
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def publish(self, state: int):
+        # any thread; the state only ever changes on the loop
+        try:
+            self.loop.call_soon_threadsafe(self._broadcast, state)
+        except RuntimeError:
+            pass # loop already closed during shutdown
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(backend.start_ipc_server(self.name, self._serve, c.IPC_LINE_LIMIT))
+        except OSError:
+            self.logger.exception("Failed to open the IPC endpoint")
+            self.loop.close()
+            return
+        self.logger.info("Serving IME state on %s", backend.ipc_address(self.name))
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            # let every connection run its cleanup while the loop can still close transports
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+            self.logger.info("IpcServer stopped")
+
+    def _message(self, state: int):
+        language = "가" if state == c.KOREAN_MODE else "A" if state == c.ENGLISH_MODE else None
+        return (json.dumps({ "state": state, "language": language }, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _broadcast(self, state: int):
+        if state == self.published:
+            return
+        self.published = state
+        line = self._message(state)
+        for writer in list(self.subscribers):
+            # a client that stopped reading gets disconnected instead of growing our buffers
+            if writer.transport.get_write_buffer_size() > c.IPC_MAX_BUFFER:
+                self.logger.warning("Dropping slow subscriber")
+                self.subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    def _reply(self, request) -> bytes:
+        command = request.get("cmd") if isinstance(request, dict) else None
+        if command == "get":
+            return self._message(self.detector.key_state)
+        if command == "show":
+            self.show()
+            return b'{"ok": true}\n'
+        return (json.dumps({ "error": f"unknown command {command!r}" }) + "\n").encode("utf-8")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.set(self.clients.value + 1)
+        try:
+            while line := await reader.readline():
+                self.requests.inc()
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    writer.write(b'{"error": "invalid json"}\n')
+                    continue
+                if isinstance(request, dict) and request.get("cmd") == "subscribe":
+                    self.subscribers.add(writer)
+                    writer.write(self._message(self.detector.key_state))
+                else:
+                    writer.write(self._reply(request))
+                await writer.drain()
+        except (ConnectionError, ValueError): # ValueError: line longer than the limit
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            self.clients.set(self.clients.value - 1)
+            writer.close()
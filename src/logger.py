@@ -1,32 +1,101 @@
 import logging
+import logging.handlers
 import os
+import queue
+from collections import deque
 import keyboard
 
+import src.constants as c
+
 LOGS_DIR = os.path.abspath("logs")
 
 LOGGER_INITIALIZED = False
+log_listener: logging.handlers.QueueListener | None = None
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler.prepare() formats the message on the calling thread; leave that to the writer thread
+    def prepare(self, record: logging.LogRecord):
+        return record
+
 def initialize():
-    global LOGGER_INITIALIZED
+    global LOGGER_INITIALIZED, log_listener
     os.makedirs(LOGS_DIR, exist_ok=True)
-    logging.basicConfig(
-        filename=os.path.join(LOGS_DIR, "app.log"),
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        filemode="w"
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(LOGS_DIR, "app.log"),
+        maxBytes=c.LOG_MAX_BYTES,
+        backupCount=c.LOG_BACKUP_COUNT,
+        encoding="utf-8",
+        delay=True,
     )
+    if os.path.exists(file_handler.baseFilename) and os.path.getsize(file_handler.baseFilename) > 0:
+        file_handler.doRollover() # keep the previous run's log instead of truncating it
+    file_handler.setFormatter(logging.Formatter(
+        fmt="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    ))
+
+    log_queue = queue.SimpleQueue()
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(DeferredQueueHandler(log_queue))
     LOGGER_INITIALIZED = True
 
+def shutdown():
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
 def get_logger(name: str):
     if not LOGGER_INITIALIZED:
         initialize()
     return logging.getLogger(name)
 
+class RingDumpHandler(logging.Handler):
+    def __init__(self, key_logger: "KeyPressLogger"):
+        super().__init__(level=logging.ERROR)
+        self.key_logger = key_logger
+
+    def emit(self, record: logging.LogRecord):
+        self.key_logger.dump()
+
 class KeyPressLogger:
-    def __init__(self):
+    def __init__(self, monitor, mode: int = c.E_KEYLOGMODE.ERROR_ONLY):
         self.logger = get_logger("KeyPressLogger")
-        keyboard.hook(self.callback)
+        self.ring: deque[tuple[float, str, str | None, int]] = deque(maxlen=c.KEY_LOG_RING_SIZE)
+        self.monitor = monitor
+        self.handle = None
+        self.set_mode(mode)
+        logging.getLogger().addHandler(RingDumpHandler(self))
         self.logger.info("KeyPressLogger initialized")
 
+    def set_mode(self, mode: int):
+        self.mode = mode
+        self.ring.clear()
+        # when off, stay out of the dispatch path entirely
+        if mode == c.E_KEYLOGMODE.OFF and self.handle is not None:
+            self.monitor.unregister(self.handle)
+            self.handle = None
+        elif mode != c.E_KEYLOGMODE.OFF and self.handle is None:
+            self.handle = self.monitor.register(None, self.callback)
+        self.logger.info("KeyPressLogger mode set to %d", mode)
+
     def callback(self, e: keyboard.KeyboardEvent):
-        self.logger.info(f"{e.event_type} {e.name} ({e.scan_code})")
+        # runs on the low-level keyboard hook thread: no file I/O and no string formatting here
+        if self.mode == c.E_KEYLOGMODE.ERROR_ONLY:
+            self.ring.append((e.time, e.event_type, e.name, e.scan_code))
+        elif self.mode == c.E_KEYLOGMODE.ALWAYS:
+            self.logger.info("%s %s (%d)", e.event_type, e.name, e.scan_code)
+
+    def dump(self):
+        entries = list(self.ring)
+        self.ring.clear()
+        if not entries:
+            return
+        self.logger.info("Last %d key events:", len(entries))
+        for timestamp, event_type, name, scan_code in entries:
+            self.logger.info("  %.3f %s %s (%d)", timestamp, event_type, name, scan_code)
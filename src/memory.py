@@ -0,0 +1,48 @@
+import gc
+import tracemalloc
+
+from src.cpp import get_process_memory, trim_working_set
+from src.logger import get_logger
+from src.metrics import metrics
+import src.constants as c
+
+logger = get_logger("Memory")
+
+def release(reason: str, trim: bool = False):
+    collected = gc.collect()
+    # trimming hands every page back, including the hook and Tk code the next key press needs: the faults
+    # land on the latency-sensitive path. only worth it once, for the pages used by startup alone
+    if trim:
+        trim_working_set()
+    logger.info("Released memory (%s): %d objects collected", reason, collected)
+
+def release_startup():
+    # everything alive now lives for the whole session: freezing keeps it out of every later collection
+    release("startup", trim=True)
+    gc.freeze()
+
+def set_tracing(enabled: bool):
+    if enabled == tracemalloc.is_tracing():
+        return
+    if enabled:
+        tracemalloc.start(c.TRACEMALLOC_FRAMES)
+    else:
+        tracemalloc.stop()
+    logger.info("Allocation tracing %s", "started" if enabled else "stopped")
+
+def report(top: int = c.TRACEMALLOC_TOP) -> str:
+    lines = []
+    if counters := get_process_memory():
+        metrics.gauge("working_set_bytes").set(counters["working_set"])
+        lines.append("Working set: {:.1f} MiB (peak {:.1f} MiB), private: {:.1f} MiB".format(
+            counters["working_set"] / 2**20, counters["peak_working_set"] / 2**20, counters["private"] / 2**20))
+    lines.append("GC objects: %d, frozen: %d" % (len(gc.get_objects()), gc.get_freeze_count()))
+
+    if not tracemalloc.is_tracing():
+        lines.append("Allocation tracing is off")
+        return "\n".join(lines)
+    current, peak = tracemalloc.get_traced_memory()
+    lines.append("Traced: {:.1f} KiB (peak {:.1f} KiB), top {} allocators:".format(current / 1024, peak / 1024, top))
+    for stat in tracemalloc.take_snapshot().statistics("lineno")[:top]:
+        lines.append(f"  {stat}")
+    return "\n".join(lines)
@@ -0,0 +1,143 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.logger import get_logger
+import src.constants as c
+
+# updates are plain attribute writes without locking: an increment lost to a thread switch
+# is acceptable for diagnostics, a lock on the hook thread is not
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+class Gauge:
+    __slots__ = ("value", "max")
+
+    def __init__(self):
+        self.value = 0
+        self.max = 0
+
+    def set(self, value: int):
+        self.value = value
+        if value > self.max: self.max = value
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: tuple[float, ...] = c.METRICS_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max: self.max = ms
+
+    def percentile(self, p: float):
+        # upper bound of the bucket holding the p-th observation
+        if self.count == 0:
+            return 0.0
+        target = p * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.total,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "buckets": { f"le_{bound}": count for bound, count in zip(self.bounds, self.counts) } | { "le_inf": self.counts[-1] },
+        }
+
+class MetricsRegistry:
+    def __init__(self):
+        self.started = time.time()
+        self.counters: dict[str, Counter] = {}
+        self.gauges: dict[str, Gauge] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str) -> Counter:
+        if (counter := self.counters.get(name)) is None:
+            with self._lock:
+                counter = self.counters.setdefault(name, Counter())
+        return counter
+
+    def gauge(self, name: str) -> Gauge:
+        if (gauge := self.gauges.get(name)) is None:
+            with self._lock:
+                gauge = self.gauges.setdefault(name, Gauge())
+        return gauge
+
+    def histogram(self, name: str) -> Histogram:
+        if (histogram := self.histograms.get(name)) is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def snapshot(self):
+        return {
+            "uptime_s": time.time() - self.started,
+            "counters": { name: counter.value for name, counter in list(self.counters.items()) },
+            "gauges": { name: { "value": gauge.value, "max": gauge.max } for name, gauge in list(self.gauges.items()) },
+            "histograms": { name: histogram.snapshot() for name, histogram in list(self.histograms.items()) },
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+metrics = MetricsRegistry()
+
+class MetricsServer:
+    def __init__(self, port: int, registry: MetricsRegistry = metrics):
+        self.logger = get_logger("MetricsServer")
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.to_json().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        # loopback only, this is never meant to be reachable from the network
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.logger.info("Serving metrics on http://127.0.0.1:%d/metrics", self.server.server_address[1])
+
+    def quit(self):
+        self.server.shutdown()
+        self.server.server_close()
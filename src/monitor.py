@@ -1,30 +1,209 @@
+import threading
+import time
 import keyboard as k
 from typing import Callable
 
+from src.logger import get_logger
+from src.metrics import metrics
+import src.constants as c
+
+class Coalescer:
+    type Hook = Callable[[k.KeyboardEvent], None]
+
+    # the first event of a burst goes through at once, the rest collapse into one trailing call with the latest event
+    def __init__(self, callback: Hook, deliver: Hook, interval: Callable[[], float]):
+        self.callback = callback
+        self.deliver = deliver
+        self.interval = interval
+        self.coalesced = metrics.counter("key_events_coalesced")
+
+        self.last = float("-inf")
+        self.pending: k.KeyboardEvent | None = None
+        self.timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    def __call__(self, e: k.KeyboardEvent):
+        now = time.perf_counter()
+        with self._lock:
+            interval = self.interval()
+            if self.timer is None and now - self.last >= interval:
+                self.last = now
+            else:
+                if self.pending is not None:
+                    self.coalesced.inc()
+                self.pending = e
+                if self.timer is None:
+                    self.timer = threading.Timer(max(0.0, self.last + interval - now), self._flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        self.callback(e)
+
+    def _flush(self):
+        with self._lock:
+            e, self.pending, self.timer = self.pending, None, None
+            self.last = time.perf_counter()
+        if e is not None:
+            self.deliver(e)
+
+    def cancel(self):
+        with self._lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.pending, self.timer = None, None
+
 class KeyboardMonitor:
     type Event = k.KeyboardEvent
     type Hook = Callable[[k.KeyboardEvent], None]
+    type Filter = Callable[[k.KeyboardEvent], bool]
+    type Handle = int
 
-    hook_removers: list[Callable[[], None]] = []
+    EVENT_TYPES = (k.KEY_DOWN, k.KEY_UP)
 
     def __init__(self):
-        self.register_hooks()
-    
+        self.logger = get_logger("KeyboardMonitor")
+        self.dispatch_time = metrics.histogram("hook_callback")
+
+        self.handlers: dict[KeyboardMonitor.Handle, tuple[int | None, tuple[str, ...], KeyboardMonitor.Hook]] = {}
+        self.stats: dict[KeyboardMonitor.Handle, list[int]] = {} # [calls, total ns, max ns]
+        # rebuilt on every (un)registration and swapped in whole, so the hook thread never sees a partial table
+        self.table: dict[tuple[int, str], tuple[tuple[KeyboardMonitor.Handle, KeyboardMonitor.Hook], ...]] = {}
+        self.catch_all: tuple[tuple[KeyboardMonitor.Handle, KeyboardMonitor.Hook], ...] = ()
+        self.coalescers: dict[KeyboardMonitor.Handle, Coalescer] = {}
+        self.filters: dict[KeyboardMonitor.Handle, KeyboardMonitor.Filter] = {}
+        self.coalesce_interval = 0.0
+
+        # scan codes currently held, a second 'down' without an 'up' in between is an auto-repeat
+        self.pressed: set[int] = set()
+        self.repeats_dropped = metrics.counter("key_repeats_dropped")
+        self.recorder: KeyboardMonitor.Hook | None = None
+
+        self._next_handle = 1
+        self._hook = None
+        self.install()
+
+    def install(self):
+        if self._hook is None:
+            self._hook = k.hook(self.dispatch)
+
+    def register(self, key: int | None, callback: Hook, event_types: tuple[str, ...] = EVENT_TYPES, coalesce: bool = False,
+                 accept: Filter | None = None) -> Handle:
+        handle = self._next_handle
+        self._next_handle += 1
+        self.handlers[handle] = (key, event_types, callback)
+        self.stats[handle] = [0, 0, 0]
+        if accept is not None:
+            # checked ahead of coalescing, so an event the callback would ignore never replaces one it acts on
+            self.filters[handle] = accept
+        if coalesce:
+            # trailing calls run on a timer thread, route them through _call for the same stats and error handling
+            self.coalescers[handle] = Coalescer(callback, lambda e: self._call(((handle, callback),), e), lambda: self.coalesce_interval)
+        self._rebuild()
+        self.logger.info("Registered handler %d (%s) for key %s", handle, getattr(callback, "__qualname__", callback), key)
+        return handle
+
+    def unregister(self, handle: Handle):
+        if self.handlers.pop(handle, None) is None:
+            return
+        self.stats.pop(handle, None)
+        self.filters.pop(handle, None)
+        if (coalescer := self.coalescers.pop(handle, None)) is not None:
+            coalescer.cancel()
+        self._rebuild()
+        self.logger.info("Unregistered handler %d", handle)
+
     def register_hooks(self, *hooks: tuple[int, Hook]):
-        for key, callback in hooks:
-            hook_remover = k.hook_key(key, callback)
-            self.hook_removers.append(hook_remover)
-    
-    def unregister_hooks(self, *hooks: list[int]):
-        for hook_remover in [i for i in hooks if i in self.hook_removers]:
-            hook_remover()
-            self.hook_removers.remove(hook_remover)
-    
+        return [self.register(key, callback) for key, callback in hooks]
+
+    def unregister_hooks(self, *handles: Handle):
+        for handle in handles:
+            self.unregister(handle)
+
     def unregister_all(self):
-        for hook in self.hooks:
-            k.unhook(hook)
-        
-        self.hooks = []
+        self.handlers.clear()
+        self.stats.clear()
+        self.filters.clear()
+        for coalescer in self.coalescers.values():
+            coalescer.cancel()
+        self.coalescers.clear()
+        self._rebuild()
+
+    @staticmethod
+    def _filtered(accept: Filter, callback: Hook) -> Hook:
+        def filtered(e: k.KeyboardEvent):
+            if accept(e):
+                callback(e)
+        return filtered
+
+    def _rebuild(self):
+        table: dict[tuple[int, str], list[tuple[KeyboardMonitor.Handle, KeyboardMonitor.Hook]]] = {}
+        catch_all = []
+        for handle, (key, event_types, callback) in self.handlers.items():
+            callback = self.coalescers.get(handle, callback)
+            if (accept := self.filters.get(handle)) is not None:
+                callback = self._filtered(accept, callback)
+            if key is None:
+                catch_all.append((handle, callback))
+                continue
+            for event_type in event_types:
+                table.setdefault((key, event_type), []).append((handle, callback))
+        self.table = { slot: tuple(entries) for slot, entries in table.items() }
+        self.catch_all = tuple(catch_all)
+
+    def dispatch(self, e: Event):
+        started = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder(e)
+        if e.event_type == k.KEY_DOWN and e.scan_code not in c.MAKE_ONLY_KEYS:
+            if e.scan_code in self.pressed:
+                self.repeats_dropped.inc()
+                return
+            self.pressed.add(e.scan_code)
+        else:
+            # a lost 'up' costs at most one press, the next release clears it
+            self.pressed.discard(e.scan_code)
+        if self.catch_all:
+            self._call(self.catch_all, e)
+        if (entries := self.table.get((e.scan_code, e.event_type))) is not None:
+            self._call(entries, e)
+        self.dispatch_time.observe(time.perf_counter() - started)
+
+    def _call(self, entries: tuple[tuple[Handle, Hook], ...], e: Event):
+        for handle, callback in entries:
+            started = time.perf_counter_ns()
+            try:
+                callback(e)
+            except Exception:
+                self.logger.exception("Handler %d failed", handle)
+            elapsed = time.perf_counter_ns() - started
+            if (stat := self.stats.get(handle)) is not None:
+                stat[0] += 1
+                stat[1] += elapsed
+                if elapsed > stat[2]: stat[2] = elapsed
+
+    def handler_stats(self):
+        result = {}
+        for handle, (calls, total, peak) in list(self.stats.items()):
+            if (handler := self.handlers.get(handle)) is None:
+                continue
+            key, _, callback = handler
+            result[handle] = {
+                "callback": getattr(callback, "__qualname__", repr(callback)),
+                "key": key,
+                "calls": calls,
+                "avg_us": total / calls / 1000 if calls else 0.0,
+                "max_us": peak / 1000,
+            }
+        return result
+
+    def input_stats(self):
+        return {
+            "repeats_dropped": self.repeats_dropped.value,
+            "coalesced": metrics.counter("key_events_coalesced").value,
+        }
 
     def quit(self):
         self.unregister_all()
+        if self._hook is not None:
+            k.unhook(self._hook)
+            self._hook = None
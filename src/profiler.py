@@ -0,0 +1,33 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, elapsed: float):
+        with self._lock:
+            self.phases.append((name, elapsed))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        with self._lock:
+            phases = list(self.phases)
+        lines = [f"Startup profile ({self.elapsed() * 1000:.1f} ms since launch):"]
+        lines.extend(f"  {name}: {elapsed * 1000:.1f} ms" for name, elapsed in phases)
+        return "\n".join(lines)
+
+startup_profile = StartupProfile()
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from src.cpp import LanguageDetector
+from src.logger import get_logger
+import src.constants as c
+
+class ImeSettleScheduler:
+    type Callback = Callable[[str | None], None]
+
+    def __init__(self, detector: LanguageDetector, callback: Callback):
+        self.logger = get_logger("ImeSettleScheduler")
+
+        self.detector = detector
+        self.callback = callback
+
+        self.settle_times: deque[float] = deque(maxlen=c.IME_SETTLE_HISTORY)
+        self.last_settle_time = 0.0
+        self.unchanged = 0
+
+        self._cond = threading.Condition()
+        self._pending: tuple[int, float, bool] | None = None
+        self._generation = 0
+        self._running = True
+        self.settling = False
+
+        self._thread = threading.Thread(target=self._worker, name="ImeSettleScheduler", daemon=True)
+        self._thread.start()
+
+    def request(self, always_toggles: bool = False):
+        # keyboard runs handlers on its own thread after the low-level hook has returned, so the target window
+        # may already have toggled: a fresh query here can be the post-toggle state. the committed key_state
+        # (kept current by the watcher) is the baseline, and _settle's first query catches an early toggle
+        started = time.perf_counter()
+        baseline = self.detector.key_state
+        with self._cond:
+            self._generation += 1
+            self._pending = (baseline, started, always_toggles)
+            self.settling = True
+            self._cond.notify()
+
+    def observe(self, state: int):
+        # a change the watcher picked up by itself (mouse, IME toolbar, focus switch). while a key press is
+        # settling, that press publishes the result, so each change reaches the callback once
+        with self._cond:
+            if self.settling or not self.detector.commit(state):
+                return
+        self.callback(self.detector.get_current_language())
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                baseline, started, always_toggles = self._pending
+                self._pending = None
+                generation = self._generation
+
+            if self._settle(baseline, started, self._deadline(always_toggles), generation):
+                self.callback(self.detector.get_current_language())
+            with self._cond:
+                self.settling = self._pending is not None
+
+    def _deadline(self, always_toggles: bool):
+        # the Hangul key always toggles, so wait for the change however slow the IME is. an Alt press may not
+        # toggle at all, give up on it after a few times what toggles have taken on this machine
+        if always_toggles:
+            return c.IME_SETTLE_TOGGLE_DEADLINE
+        if (p95 := self.settle_percentile(0.95)) is None:
+            return c.IME_SETTLE_STABLE
+        return min(max(c.IME_SETTLE_STABLE, c.IME_SETTLE_STABLE_FACTOR * p95), c.IME_SETTLE_TOGGLE_DEADLINE)
+
+    def _settle(self, baseline: int, started: float, deadline: float, generation: int):
+        stable_until = started + deadline
+        delay = c.IME_SETTLE_FIRST_DELAY
+        while True:
+            state = self.detector.query()
+            now = time.perf_counter()
+            if state != baseline:
+                break
+            if now >= stable_until:
+                self.unchanged += 1
+                self.detector.commit(state)
+                self.logger.debug("IME unchanged after %.1f ms (state %d)", (now - started) * 1000, state)
+                return True
+            time.sleep(min(delay, stable_until - now))
+            delay = min(delay * 2, c.IME_SETTLE_MAX_DELAY)
+            if self._generation != generation: # superseded by a newer key press
+                return False
+
+        self.detector.commit(state)
+        self.last_settle_time = now - started
+        self.settle_times.append(self.last_settle_time)
+        self.logger.debug("IME settled in %.1f ms (state %d -> %d)", self.last_settle_time * 1000, baseline, state)
+        return True
+
+    def settle_percentile(self, p: float):
+        if not self.settle_times:
+            return None
+        ordered = sorted(self.settle_times)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def quit(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
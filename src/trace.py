@@ -0,0 +1,141 @@
+import struct
+import sys
+from array import array
+from typing import Iterator
+
+import keyboard as k
+
+from src.logger import get_logger
+import src.constants as c
+
+# header: magic, version, event count, string count
+# then the string table (u16 length + utf-8 each), then one column after another, little-endian
+TRACE_MAGIC = b"KRTT"
+TRACE_VERSION = 1
+HEADER = struct.Struct("<4sHII")
+STRING_LENGTH = struct.Struct("<H")
+
+EVENT_TYPES = (k.KEY_DOWN, k.KEY_UP)
+
+class Trace:
+    type Event = tuple[float, str, str | None, int] # time, event type, name, scan code
+
+    # columnar ring buffer: a fixed number of events costs the same memory whatever was typed
+    def __init__(self, capacity: int = c.TRACE_CAPACITY):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.scan_codes = array("i", bytes(4 * capacity))
+        self.name_ids = array("H", bytes(2 * capacity))
+        self.event_types = array("B", bytes(capacity))
+        self.head = 0
+        self.count = 0
+
+        # id 0 is reserved for events without a name
+        self.strings: list[str | None] = [None]
+        self.string_ids: dict[str | None, int] = { None: 0 }
+
+    def __len__(self):
+        return self.count
+
+    def intern(self, name: str | None) -> int:
+        if (string_id := self.string_ids.get(name)) is not None:
+            return string_id
+        if len(self.strings) > 0xFFFF:
+            return 0
+        string_id = self.string_ids[name] = len(self.strings)
+        self.strings.append(name)
+        return string_id
+
+    def append(self, timestamp: float, event_type: str, name: str | None, scan_code: int):
+        i = self.head
+        self.times[i] = timestamp
+        self.scan_codes[i] = scan_code
+        self.name_ids[i] = self.intern(name)
+        self.event_types[i] = 0 if event_type == k.KEY_DOWN else 1
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def _order(self) -> Iterator[int]:
+        start = (self.head - self.count) % self.capacity
+        return (i % self.capacity for i in range(start, start + self.count))
+
+    def __iter__(self) -> Iterator[Event]:
+        for i in self._order():
+            yield self.times[i], EVENT_TYPES[self.event_types[i]], self.strings[self.name_ids[i]], self.scan_codes[i]
+
+    def save(self, path: str):
+        order = list(self._order())
+        columns = (
+            array("d", (self.times[i] for i in order)),
+            array("i", (self.scan_codes[i] for i in order)),
+            array("H", (self.name_ids[i] for i in order)),
+            array("B", (self.event_types[i] for i in order)),
+        )
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(order), len(self.strings) - 1))
+            for name in self.strings[1:]:
+                encoded = (name or "").encode("utf-8")
+                f.write(STRING_LENGTH.pack(len(encoded)))
+                f.write(encoded)
+            for column in columns:
+                if sys.byteorder == "big":
+                    column.byteswap()
+                f.write(column.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "Trace":
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, count, string_count = HEADER.unpack_from(data)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} key trace")
+
+        trace = cls(max(count, 1))
+        offset = HEADER.size
+        for _ in range(string_count):
+            (length,) = STRING_LENGTH.unpack_from(data, offset)
+            offset += STRING_LENGTH.size
+            trace.strings.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        trace.string_ids = { name: string_id for string_id, name in enumerate(trace.strings) }
+
+        for column in (trace.times, trace.scan_codes, trace.name_ids, trace.event_types):
+            size = column.itemsize * count
+            loaded = array(column.typecode, data[offset:offset + size])
+            if sys.byteorder == "big":
+                loaded.byteswap()
+            column[:count] = loaded
+            offset += size
+        trace.count = count
+        trace.head = count % trace.capacity
+        return trace
+
+class TraceRecorder:
+    def __init__(self, monitor, capacity: int = c.TRACE_CAPACITY):
+        self.logger = get_logger("TraceRecorder")
+        self.monitor = monitor
+        self.trace = Trace(capacity)
+
+    @property
+    def recording(self):
+        return self.monitor.recorder is not None
+
+    def set_recording(self, recording: bool):
+        if recording == self.recording:
+            return
+        # raw events, taken before repeats are dropped, so a replay goes through the same conditioning
+        self.monitor.recorder = self.record if recording else None
+        self.logger.info("Key trace recording %s", "started" if recording else "stopped")
+
+    def record(self, e: k.KeyboardEvent):
+        # hook thread: a handful of array stores, nothing else
+        self.trace.append(e.time, e.event_type, e.name, e.scan_code)
+
+    def save(self, path: str):
+        self.trace.save(path)
+        self.logger.info("Saved %d key events to %s", len(self.trace), path)
@@ -1,53 +1,104 @@
-from pystray import MenuItem, Menu, Icon
-from PIL import Image
+import os
 import threading
 
 from src.conf import Configuration
 from src.utils import build_resource
-from src.logger import get_logger
+from src.logger import get_logger, LOGS_DIR
+from src.metrics import metrics
+from src import memory
+from src.profiler import startup_profile
 import src.constants as c
 
 class AppTray:
-    def __init__(self, config: Configuration, global_quit):
+    def __init__(self, config: Configuration, global_quit, save_trace):
         self.logger = get_logger("AppTray")
         self.logger.info("Initializing AppTray")
 
         self.conf = config
         self.global_quit = global_quit
-        self.setup_tray_icon()
+        self.save_trace = save_trace
+        self.icon = None
+        self.stopped = False
+        self.running = False
+        self._lock = threading.Lock()
     
     def set_fadeout_speed(self, speed):
         def _():
-            self.logger.info(f"fade_duration to {speed}")
+            self.logger.info("fade_duration to %s", speed)
             self.conf.fade_duration = speed
         return _
     
     def set_window_size(self, size):
         def _():
-            self.logger.info(f"window_size_ratio to {size}")
+            self.logger.info("window_size_ratio to %s", size)
             self.conf.window_size_ratio = size
         return _
     
     def set_monitor_conf(self, val):
         def _():
-            self.logger.info(f"monitor_conf to {val}")
+            self.logger.info("monitor_conf to %s", val)
             self.conf.monitor_conf = val
         return _
 
     def set_window_lifetime(self, time):
         def _():
-            self.logger.info(f"window_lifetime to {time}")
+            self.logger.info("window_lifetime to %s", time)
             self.conf.window_lifetime = time
         return _
 
     def set_initial_alpha(self, alpha):
         def _():
-            self.logger.info(f"initial_alpha to {alpha}")
+            self.logger.info("initial_alpha to %s", alpha)
             self.conf.initial_alpha = alpha
         return _
 
+    def toggle_show_cached_on_focus(self):
+        self.conf.show_cached_on_focus = not self.conf.show_cached_on_focus
+        self.logger.info("show_cached_on_focus to %s", self.conf.show_cached_on_focus)
+
+    def export_metrics(self):
+        path = os.path.join(LOGS_DIR, "metrics.json")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(metrics.to_json())
+        self.logger.info("Exported metrics to %s", path)
+
+    def export_memory_report(self):
+        report = memory.report()
+        path = os.path.join(LOGS_DIR, "memory.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        self.logger.info("Memory report written to %s\n%s", path, report)
+
+    def toggle_trace_allocations(self):
+        self.conf.trace_allocations = not self.conf.trace_allocations
+        self.logger.info("trace_allocations to %s", self.conf.trace_allocations)
+
+    def set_idle_release_after(self, seconds):
+        def _():
+            self.logger.info("idle_release_after to %s", seconds)
+            self.conf.idle_release_after = seconds
+        return _
+
+    def toggle_record_key_trace(self):
+        self.conf.record_key_trace = not self.conf.record_key_trace
+        self.logger.info("record_key_trace to %s", self.conf.record_key_trace)
+
+    def set_key_log_mode(self, mode):
+        def _():
+            self.logger.info("key_log_mode to %s", mode)
+            self.conf.key_log_mode = mode
+        return _
+
     def setup_tray_icon(self):
-        image = Image.open(build_resource("icon.png"))
+        # pystray and PIL are only needed once the tray thread starts, keep them off the startup path
+        with startup_profile.phase("import pystray, PIL"):
+            from pystray import MenuItem, Menu, Icon
+            from PIL import Image
+
+        # only a tray-sized copy stays alive, the decoded source image and its file are released here
+        with Image.open(build_resource("icon.png")) as source:
+            source.thumbnail((c.TRAY_ICON_SIZE, c.TRAY_ICON_SIZE))
+            image = source.copy()
         menu = (
             MenuItem(
                 '창 유지 시간',
@@ -93,8 +144,33 @@ class AppTray:
                     MenuItem('항상 주 모니터에 표시', self.set_monitor_conf(c.E_MONITORCONF.PRIMARY), radio=True, checked=lambda x: self.conf.monitor_conf == c.E_MONITORCONF.PRIMARY, default=True),
                     MenuItem('커서가 있는 모니터에 표시', self.set_monitor_conf(c.E_MONITORCONF.CURSOR), radio=True, checked=lambda x: self.conf.monitor_conf == c.E_MONITORCONF.CURSOR),
                     MenuItem('활성 윈도우가 있는 모니터에 표시', self.set_monitor_conf(c.E_MONITORCONF.FOCUSED), radio=True, checked=lambda x: self.conf.monitor_conf == c.E_MONITORCONF.FOCUSED),
+                    MenuItem('모든 모니터에 표시', self.set_monitor_conf(c.E_MONITORCONF.ALL), radio=True, checked=lambda x: self.conf.monitor_conf == c.E_MONITORCONF.ALL),
+                    MenuItem('텍스트 커서 옆에 표시', self.set_monitor_conf(c.E_MONITORCONF.CARET), radio=True, checked=lambda x: self.conf.monitor_conf == c.E_MONITORCONF.CARET),
+                )
+            ),
+            MenuItem('창 전환 시 마지막 상태 바로 표시', self.toggle_show_cached_on_focus, checked=lambda x: self.conf.show_cached_on_focus),
+            MenuItem(
+                '키 입력 기록',
+                Menu(
+                    MenuItem('끄기', self.set_key_log_mode(c.E_KEYLOGMODE.OFF), radio=True, checked=lambda x: self.conf.key_log_mode == c.E_KEYLOGMODE.OFF),
+                    MenuItem('오류 발생 시에만', self.set_key_log_mode(c.E_KEYLOGMODE.ERROR_ONLY), radio=True, checked=lambda x: self.conf.key_log_mode == c.E_KEYLOGMODE.ERROR_ONLY, default=True),
+                    MenuItem('항상', self.set_key_log_mode(c.E_KEYLOGMODE.ALWAYS), radio=True, checked=lambda x: self.conf.key_log_mode == c.E_KEYLOGMODE.ALWAYS),
+                    MenuItem('재생용 트레이스 기록', self.toggle_record_key_trace, checked=lambda x: self.conf.record_key_trace),
+                    MenuItem('트레이스 저장', self.save_trace),
                 )
             ),
+            MenuItem(
+                '메모리',
+                Menu(
+                    MenuItem('사용량 보고', self.export_memory_report),
+                    MenuItem('할당 추적', self.toggle_trace_allocations, checked=lambda x: self.conf.trace_allocations),
+                    MenuItem('유휴 시 해제 안 함', self.set_idle_release_after(0.0), radio=True, checked=lambda x: self.conf.idle_release_after == 0),
+                    MenuItem('1분 유휴 후 해제', self.set_idle_release_after(60.0), radio=True, checked=lambda x: self.conf.idle_release_after == 60),
+                    MenuItem('5분 유휴 후 해제', self.set_idle_release_after(300.0), radio=True, checked=lambda x: self.conf.idle_release_after == 300, default=True),
+                    MenuItem('30분 유휴 후 해제', self.set_idle_release_after(1800.0), radio=True, checked=lambda x: self.conf.idle_release_after == 1800),
+                )
+            ),
+            MenuItem('성능 지표 내보내기', self.export_metrics),
             MenuItem('설정 다시 불러오기', self.conf.load_from_json),
             MenuItem('종료', self.global_quit),
         )
@@ -104,10 +180,34 @@ class AppTray:
 
     def run(self):
         self.logger.info("Running AppTray")
-        self.tray_thread = threading.Thread(target=self.icon.run)
+        self.tray_thread = threading.Thread(target=self._run)
         self.tray_thread.daemon = True
         self.tray_thread.start()
+
+    def _run(self):
+        with startup_profile.phase("tray"):
+            self.setup_tray_icon()
+        self.logger.info(startup_profile.report())
+        with self._lock:
+            if self.stopped:
+                return
+        assert self.icon is not None
+        self.icon.run(setup=self._on_ready)
+
+    def _on_ready(self, icon):
+        # runs inside icon.run() once its loop can take stop(); a quit() that came in before then is honoured here
+        icon.visible = True
+        with self._lock:
+            self.running = True
+            stopped = self.stopped
+        if stopped:
+            icon.stop()
     
     def quit(self):
         self.logger.info("Quitting AppTray")
-        self.icon.stop()
+        with self._lock:
+            self.stopped = True
+            running = self.running
+        if running:
+            assert self.icon is not None
+            self.icon.stop()
@@ -1,11 +1,16 @@
+import sys
+import time
 import tkinter
 import tkinter.font
-import tkinter.ttk
-import time
+from collections import OrderedDict
 
+from src.animation import Animation, linear
+from src.channel import CommandChannel
 from src.conf import Configuration
-from src.cpp import get_monitor_rect
+from src.cpp import get_monitor_rect, get_all_monitor_rects, get_monitor_rect_at, get_caret_rect, monitor_topology
 from src.logger import get_logger
+from src.metrics import metrics
+from src import memory
 import src.constants as c
 
 class RoundFrame(tkinter.Canvas):
@@ -14,14 +19,24 @@ class RoundFrame(tkinter.Canvas):
         self.radius = radius
         self.bg = bg
         self.configure(bg=c.TRANSPARENT_COLOR, highlightthickness=0, bd=0)
+        self.drawn_size: tuple[int, int] | None = None
         self.bind("<Configure>", self._draw_rounded_rect)
 
     def _draw_rounded_rect(self, event=None):
-        self.delete("all")
-        width = self.winfo_width()
-        height = self.winfo_height()
+        self.draw(self.winfo_width(), self.winfo_height())
+
+    def draw(self, width, height):
+        # <Configure> also fires on map/move, only redraw when the size actually changed
+        if (width, height) == self.drawn_size:
+            return
+        self.drawn_size = (width, height)
 
+        self.delete("all")
         self.create_rounded_rect(0, 0, width, height, self.radius, fill=self.bg)
+        self.draw_content(width, height)
+
+    def draw_content(self, width, height):
+        pass
     
     def create_rounded_rect(self, x1, y1, x2, y2, radius, **kwargs):
         points = [
@@ -40,92 +55,279 @@ class RoundFrame(tkinter.Canvas):
         ]
         return self.create_polygon(points, smooth=True, **kwargs)
 
+class PopupSurface(RoundFrame):
+    def __init__(self, parent, text: str, font: tkinter.font.Font, width: int, height: int, radius: int):
+        self.text = text
+        self.font = font
+        super().__init__(parent, radius=radius, bg=c.BACKGROUND_COLOR, width=width, height=height)
+        self.draw(width, height)
+
+    def draw_content(self, width, height):
+        self.create_text(width // 2, height // 2, text=self.text, font=self.font, fill='white')
+
+class SurfaceCache:
+    type Key = tuple[str, int, int, int]
+
+    def __init__(self, parent: tkinter.Misc, font: tkinter.font.Font, max_size: int = c.SURFACE_CACHE_SIZE):
+        self.logger = get_logger("SurfaceCache")
+        self.parent = parent
+        self.font = font
+        self.max_size = max_size
+        self.surfaces: OrderedDict[SurfaceCache.Key, PopupSurface] = OrderedDict()
+        self.current: PopupSurface | None = None
+
+    def get(self, text: str, width: int, height: int, radius: int):
+        key = (text, width, height, radius)
+        if (surface := self.surfaces.get(key)) is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = PopupSurface(self.parent, text, self.font, width, height, radius)
+        self.surfaces[key] = surface
+        self.logger.debug("Rendered surface %s", key)
+        while len(self.surfaces) > self.max_size:
+            _, evicted = self.surfaces.popitem(last=False)
+            self._destroy(evicted)
+        return surface
+
+    def show(self, surface: PopupSurface):
+        if surface is self.current:
+            return
+        if self.current is not None:
+            self.current.place_forget()
+        surface.place(x=0, y=0)
+        self.current = surface
+
+    def clear(self):
+        for surface in self.surfaces.values():
+            self._destroy(surface)
+        self.surfaces.clear()
+        self.logger.info("Surface cache cleared")
+
+    def _destroy(self, surface: PopupSurface):
+        if surface is self.current:
+            self.current = None
+        surface.destroy()
+
+class PopupWindow(tkinter.Toplevel):
+    def __init__(self, root: tkinter.Tk, font: tkinter.font.Font):
+        super().__init__(root)
+        self.overrideredirect(True)
+        self.attributes("-topmost", True)
+        self.attributes("-alpha", 0.0)
+        self.configure(bg=c.TRANSPARENT_COLOR)
+        if sys.platform == "win32": # only Windows Tk supports colour-keyed transparency
+            self.attributes('-transparentcolor', c.TRANSPARENT_COLOR)
+
+        self.surfaces = SurfaceCache(self, font)
+        self.placed_geometry: str | None = None
+        self.alpha = 0.0
+
+    def place_at(self, geometry: str):
+        if geometry != self.placed_geometry:
+            self.placed_geometry = geometry
+            self.geometry(geometry)
+
+    def set_alpha(self, alpha: float):
+        if alpha != self.alpha:
+            self.alpha = alpha
+            self.attributes('-alpha', alpha)
+
 class AppUI:
-    fade_step = 0.02
     fade_timer = None
-    fading = False
-
-    conf_listeners = []
+    fade_easing: Animation.Easing = staticmethod(linear)
 
     def __init__(self, config: Configuration, initial: str):
         self.logger = get_logger("AppUI")
         self.logger.info("Initializing AppUI")
+        self.show_popup_time = metrics.histogram("show_popup")
 
-        self.conf = config
-        self.conf_listeners.append(self.conf.listen("window_size_ratio", lambda _: self.update_geometry()))
-        self.conf_listeners.append(self.conf.listen("monitor_conf", lambda _: self.update_geometry()))
-
+        # the root only owns the event loop; popups live in one pooled window per monitor
         self.root = tkinter.Tk()
-        self.root.overrideredirect(True)
-        self.root.attributes("-topmost", True)
-        self.root.attributes("-alpha", 0.0)
-        self.root.configure(bg=c.TRANSPARENT_COLOR)
-        self.root.attributes('-transparentcolor', c.TRANSPARENT_COLOR)
+        self.root.withdraw()
+        self.fade = Animation(self.root)
+        self.commands = CommandChannel(self.root)
+
+        # listeners run on whichever thread changed the setting (tray, config watcher)
+        self.conf = config
+        self.conf_listeners: list[Configuration.Handle] = []
+        self.conf_listeners.append(self.conf.listen("window_size_ratio", lambda *_: self.commands.post("invalidate_surfaces", self.invalidate_surfaces)))
+        self.conf_listeners.append(self.conf.listen("corner_radius", lambda *_: self.commands.post("invalidate_surfaces", self.invalidate_surfaces)))
 
         self.screen_width = self.root.winfo_screenwidth()
         self.screen_height = self.root.winfo_screenheight()
-        self.logger.info(f"Screen size: {self.screen_width}x{self.screen_height}")
+        self.logger.info("Screen size: %dx%d", self.screen_width, self.screen_height)
 
-        self.update_geometry()
+        self.popup_rects: dict[tuple, tuple[str, int, int]] = {}
+        self.windows: dict[tuple, PopupWindow] = {}
+        self.visible: list[PopupWindow] = []
+        self.last_shown = time.monotonic()
+        # caret the visible popup follows, re-queried on every show since focus may have moved since
+        self.caret: tuple[int, int, int, int] | None = None
+        self.shown_text = initial
+        self.caret_timer = None
+        self.display_check_timer = self.root.after(c.DISPLAY_CHECK_INTERVAL, self.check_display)
 
-        self.width, self.height = int(self.screen_width * self.conf.window_size_ratio), int(self.screen_height * self.conf.window_size_ratio)
+        self.font = tkinter.font.Font(family='Pretendard', size=24, weight='normal')
+        self.prerender_surfaces()
+        window, width, height = self.window_for(get_monitor_rect(c.E_MONITORCONF.PRIMARY))
+        window.surfaces.show(self.surface_for(window, initial, width, height))
+        self.logger.info("AppUI initialized")
 
-        self.frame = RoundFrame(self.root, radius=40, bg=c.BACKGROUND_COLOR, width=self.width, height=self.height)
-        self.frame.pack(expand=True, fill=tkinter.BOTH)
+    def surface_for(self, window: PopupWindow, text, width, height):
+        return window.surfaces.get(text, width, height, self.conf.corner_radius)
 
-        pretendard = tkinter.font.Font(family='Pretendard', size=24, weight='normal')
+    def prerender_surfaces(self):
+        window, width, height = self.window_for(get_monitor_rect(c.E_MONITORCONF.PRIMARY))
+        for text in c.POPUP_GLYPHS:
+            self.surface_for(window, text, width, height)
 
-        self.style = tkinter.ttk.Style()
-        self.style.configure("Language.TLabel", font=pretendard, padding=20, foreground='white', background=c.BACKGROUND_COLOR)
-        
-        self.label = tkinter.ttk.Label(self.frame, text=initial, style="Language.TLabel")
-        self.label.place(relx=0.5, rely=0.5, anchor=tkinter.CENTER)
-        self.logger.info("AppUI initialized")
+    def invalidate_surfaces(self):
+        for window in self.windows.values():
+            window.surfaces.clear()
+        self.prerender_surfaces()
+
+    def popup_rect(self, screen_x=0, screen_y=0, screen_rx=None, screen_ry=None):
+        key = (screen_x, screen_y, screen_rx, screen_ry, self.conf.window_size_ratio)
+        if (cached := self.popup_rects.get(key)) is not None:
+            return cached
 
-    def update_geometry(self, screen_x=0, screen_y=0, screen_rx=None, screen_ry=None):
         if screen_rx is None: screen_width = self.screen_width
         else: screen_width = screen_rx - screen_x
         if screen_ry is None: screen_height = self.screen_height
         else: screen_height = screen_ry - screen_y
 
-        y_padding = 50
+        y_padding = c.POPUP_BOTTOM_PADDING
 
         width = int(screen_width * self.conf.window_size_ratio)
         height = int(screen_height * self.conf.window_size_ratio)
         x = int(screen_width // 2 - width // 2) + screen_x
         y = int(screen_height - height - y_padding) + screen_y
-        self.root.geometry(f"{width}x{height}+{x}+{y}")
-        self.logger.info(f"Updated geometry: {width}x{height}+{x}+{y}, screen_anchor: [{screen_x}, {screen_y}]")
+        rect = self.popup_rects[key] = (f"{width}x{height}+{x}+{y}", width, height)
+        return rect
+
+    def caret_geometry(self, caret: tuple[int, int, int, int], monitor_rect: tuple, width: int, height: int):
+        left, top, _, bottom = caret
+        screen_x, screen_y, screen_rx, screen_ry = monitor_rect
+        # below the caret, above it when that would leave the monitor
+        y = bottom + c.CARET_OFFSET
+        if y + height > screen_ry:
+            y = max(screen_y, top - height - c.CARET_OFFSET)
+        x = min(max(left, screen_x), screen_rx - width)
+        return f"{width}x{height}+{x}+{y}"
+
+    def window_for(self, monitor_rect: tuple, caret: tuple[int, int, int, int] | None = None):
+        if monitor_rect[2] is None: # primary monitor without a queried rect
+            monitor_rect = (0, 0, self.screen_width, self.screen_height)
+        if (window := self.windows.get(monitor_rect)) is None:
+            window = self.windows[monitor_rect] = PopupWindow(self.root, self.font)
+            self.logger.info("Created popup window for monitor %s", monitor_rect)
+        geometry, width, height = self.popup_rect(*monitor_rect)
+        if caret is not None:
+            geometry = self.caret_geometry(caret, monitor_rect, width, height)
+        window.place_at(geometry)
+        return window, width, height
+
+    def target_monitors(self):
+        if self.conf.monitor_conf == c.E_MONITORCONF.ALL:
+            return get_all_monitor_rects()
+        if self.conf.monitor_conf == c.E_MONITORCONF.CARET:
+            self.caret = get_caret_rect()
+            if self.caret is not None:
+                return (get_monitor_rect_at(self.caret[0], self.caret[1]),)
+            return (get_monitor_rect(c.E_MONITORCONF.FOCUSED),) # nothing with a caret focused yet
+        return (get_monitor_rect(self.conf.monitor_conf),)
+
+    def sample_caret(self):
+        self.caret_timer = None
+        # nothing to follow while hidden, the next popup restarts sampling
+        if not self.visible or self.conf.monitor_conf != c.E_MONITORCONF.CARET:
+            return
+        if (caret := get_caret_rect()) is not None and self.caret_moved(caret):
+            self.caret = caret
+            window, width, height = self.window_for(get_monitor_rect_at(caret[0], caret[1]), caret)
+            if self.visible != [window]:
+                # the caret crossed onto another monitor: that monitor's window, sized for it, takes over mid-fade
+                alpha = self.visible[0].alpha
+                window.surfaces.show(self.surface_for(window, self.shown_text, width, height))
+                for previous in self.visible:
+                    previous.set_alpha(0)
+                window.set_alpha(alpha)
+                self.visible = [window]
+        self.caret_timer = self.root.after(c.CARET_SAMPLE_INTERVAL, self.sample_caret)
+
+    def caret_moved(self, caret: tuple[int, int, int, int]):
+        if self.caret is None:
+            return True
+        return max(abs(caret[0] - self.caret[0]), abs(caret[3] - self.caret[3])) >= c.CARET_MOVE_THRESHOLD
+
+    def release_windows(self):
+        self.popup_rects.clear()
+        self.visible = []
+        for window in self.windows.values():
+            window.destroy()
+        self.windows.clear()
+
+    def is_idle(self):
+        if not self.windows or not self.conf.idle_release_after:
+            return False
+        if self.fade_timer is not None or self.fade.running:
+            return False
+        return time.monotonic() - self.last_shown >= self.conf.idle_release_after
+
+    def check_display(self):
+        if monitor_topology.check():
+            self.screen_width = self.root.winfo_screenwidth()
+            self.screen_height = self.root.winfo_screenheight()
+            self.release_windows()
+        elif self.is_idle():
+            # the next popup pays for one window and surface, everything in between runs without them
+            self.release_windows()
+            memory.release("idle")
+        self.display_check_timer = self.root.after(c.DISPLAY_CHECK_INTERVAL, self.check_display)
 
     def show_popup(self, text):
+        started = time.perf_counter()
         if self.fade_timer:
             self.root.after_cancel(self.fade_timer)
-        if self.fading:
-            self.fading = False
-        
-        self.update_geometry(*get_monitor_rect(self.conf.monitor_conf))
+            self.fade_timer = None
+        self.fade.cancel()
 
-        self.label.config(text=text)
-        self.root.attributes('-alpha', self.conf.initial_alpha)
+        caret_mode = self.conf.monitor_conf == c.E_MONITORCONF.CARET
+        self.shown_text = text
+        targets = []
+        for monitor_rect in self.target_monitors():
+            window, width, height = self.window_for(monitor_rect, self.caret if caret_mode else None)
+            window.surfaces.show(self.surface_for(window, text, width, height))
+            targets.append(window)
+        for window in self.visible:
+            if window not in targets:
+                window.set_alpha(0)
+        self.visible = targets
+        self.set_alpha(self.conf.initial_alpha)
+        self.last_shown = time.monotonic()
+        if caret_mode and self.caret_timer is None:
+            self.caret_timer = self.root.after(c.CARET_SAMPLE_INTERVAL, self.sample_caret)
 
         self.fade_timer = self.root.after(int(self.conf.window_lifetime * 1000), self.fade_out)
+        self.show_popup_time.observe(time.perf_counter() - started)
+
+    def set_alpha(self, alpha: float):
+        # every visible window follows the same animation clock
+        for window in self.visible:
+            window.set_alpha(alpha)
 
     def fade_out(self):
+        self.fade_timer = None
         if self.conf.fade_duration == 0:
-            self.root.attributes('-alpha', 0)
-            self.root.update()
+            self.set_alpha(0)
+            self.hidden()
             return
 
-        self.fading = True
-        steps = int(self.conf.fade_duration / self.fade_step)
-        for i in range(steps, -1, -1):
-            if not self.fading:
-                return
-            alpha = (i / steps) * self.conf.initial_alpha
-            self.root.attributes('-alpha', alpha)
-            self.root.update()
-            time.sleep(self.fade_step)
-        self.fading = False
+        self.fade.start(self.conf.fade_duration, self.conf.initial_alpha, 0, self.set_alpha, easing=self.fade_easing, on_done=self.hidden)
+
+    def hidden(self):
+        self.visible = []
 
     def run(self):
         self.logger.info("Running AppUI")
@@ -133,4 +335,7 @@ class AppUI:
     
     def quit(self):
         self.logger.info("Quitting AppUI")
+        for handle in self.conf_listeners:
+            self.conf.forget(handle)
+        self.commands.close()
         self.root.destroy()
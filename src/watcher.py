@@ -0,0 +1,98 @@
+import threading
+from typing import Callable
+
+from src.cpp import LanguageDetector, backend, get_idle_time
+from src.logger import get_logger
+import src.constants as c
+
+class ImeWatcher:
+    type Subscriber = Callable[[int], None]
+    type Handle = int
+
+    def __init__(self, detector: LanguageDetector):
+        self.logger = get_logger("ImeWatcher")
+        self.detector = detector
+
+        self.subscribers: dict[ImeWatcher.Handle, ImeWatcher.Subscriber] = {}
+        self._next_handle = 1
+        self.interval = c.IME_WATCH_MIN_INTERVAL
+        self.show_cached_on_focus = False
+        self.polls = 0
+        self.changes = 0
+
+        self._thread_id = 0
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self, subscriber: Subscriber) -> Handle:
+        handle = self._next_handle
+        self._next_handle += 1
+        self.subscribers[handle] = subscriber
+        return handle
+
+    def unsubscribe(self, handle: Handle):
+        self.subscribers.pop(handle, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ImeWatcher", daemon=True)
+        self._thread.start()
+
+    def quit(self):
+        self._running = False
+        if self._thread_id:
+            backend.post_quit(self._thread_id)
+
+    def _run(self):
+        self._thread_id = backend.current_thread_id()
+        # events are delivered through this thread's message loop
+        hooks = backend.hook_win_events(self._on_win_event, (
+            (c.EVENT_SYSTEM_FOREGROUND, c.EVENT_SYSTEM_FOREGROUND),
+            (c.EVENT_OBJECT_IME_SHOW, c.EVENT_OBJECT_IME_CHANGE),
+        ))
+        self.logger.info("ImeWatcher started")
+
+        try:
+            while self._running:
+                if not backend.pump_messages(int(self.interval * 1000)):
+                    return
+                self.poll()
+                self._adapt_interval()
+        finally:
+            backend.unhook_win_events(hooks)
+            self.logger.info("ImeWatcher stopped (%d polls, %d changes)", self.polls, self.changes)
+
+    def _adapt_interval(self):
+        if get_idle_time() < c.IME_WATCH_IDLE_AFTER:
+            self.interval = c.IME_WATCH_MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * 2, c.IME_WATCH_MAX_INTERVAL)
+
+    def _on_win_event(self, event: int, hwnd: int, idObject: int, idChild: int):
+        if event == c.EVENT_SYSTEM_FOREGROUND:
+            self.detector.prune_windows()
+            # show the last known state right away, the query below corrects it if it went stale
+            cached = self.detector.cached_state(hwnd)
+            if cached is not None and self.show_cached_on_focus:
+                self._apply(cached)
+
+        self.interval = c.IME_WATCH_MIN_INTERVAL
+        self.poll()
+
+    def poll(self):
+        self.polls += 1
+        self._apply(self.detector.query())
+
+    def _apply(self, state: int):
+        # subscribers decide whether to publish, key_state is committed by whoever does
+        if state == self.detector.key_state:
+            return
+        self.changes += 1
+        self.logger.debug("IME state changed to %d", state)
+        for handle, subscriber in list(self.subscribers.items()):
+            try:
+                subscriber(state)
+            except Exception:
+                self.logger.exception("Subscriber %d failed", handle)